@@ -0,0 +1 @@
+"""Deterministic benchmarks of saulochess, run from the repository root (see run.py)."""
@@ -0,0 +1,103 @@
+"""Scripted UCI engine standing in for Stockfish in the benchmarks.
+
+It answers every search instantly at depth 1 with a material-count evaluation and
+picks moves by a fixed ordering (checkmates, then captures by value, then UCI
+order), so a run always makes the same searches and gets the same answers, and the
+measured time is the library's own.
+
+    python benchmarks/fake_uci.py
+"""
+import sys
+
+import chess
+
+VALUES = {chess.PAWN: 100, chess.KNIGHT: 300, chess.BISHOP: 310,
+          chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 0}
+
+
+def material(board):
+    score = 0
+    for piece in board.piece_map().values():
+        value = VALUES[piece.piece_type]
+        score += value if piece.color == board.turn else -value
+    return score
+
+
+def move_key(board, move):
+    board.push(move)
+    mate = board.is_checkmate()
+    score = -material(board)
+    board.pop()
+    return (0 if mate else 1, -score, move.uci())
+
+
+def main():
+    board = chess.Board()
+    multipv = 1
+    out = sys.stdout
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens:
+            continue
+        cmd = tokens[0]
+        if cmd == "uci":
+            out.write("id name ScriptedEngine 1.0\nid author saulochess\n")
+            out.write("option name MultiPV type spin default 1 min 1 max 500\n")
+            out.write("option name Threads type spin default 1 min 1 max 512\n")
+            out.write("option name Hash type spin default 16 min 1 max 33554432\n")
+            out.write("uciok\n")
+        elif cmd == "isready":
+            out.write("readyok\n")
+        elif cmd == "setoption":
+            if "MultiPV" in tokens:
+                multipv = int(tokens[-1])
+        elif cmd == "ucinewgame":
+            board = chess.Board()
+        elif cmd == "position":
+            if tokens[1] == "startpos":
+                board = chess.Board()
+                rest = tokens[2:]
+            else:
+                idx = tokens.index("moves") if "moves" in tokens else len(tokens)
+                board = chess.Board(" ".join(tokens[2:idx]))
+                rest = tokens[idx:]
+            if rest and rest[0] == "moves":
+                for uci in rest[1:]:
+                    board.push_uci(uci)
+        elif cmd == "go":
+            searchmoves = []
+            if "searchmoves" in tokens:
+                idx = tokens.index("searchmoves") + 1
+                while idx < len(tokens) and tokens[idx] not in ("depth", "movetime", "nodes", "wtime", "btime"):
+                    searchmoves.append(chess.Move.from_uci(tokens[idx]))
+                    idx += 1
+            moves = [m for m in board.legal_moves if not searchmoves or m in searchmoves]
+            if not moves:
+                if board.is_check():
+                    out.write("info depth 0 score mate 0\n")
+                else:
+                    out.write("info depth 0 score cp 0\n")
+                out.write("bestmove (none)\n")
+                out.flush()
+                continue
+            moves.sort(key=lambda m: move_key(board, m))
+            for rank, move in enumerate(moves[:multipv], start=1):
+                board.push(move)
+                if board.is_checkmate():
+                    score = "mate 1"
+                    pv = [move]
+                else:
+                    score = "cp %d" % -material(board)
+                    replies = sorted(board.legal_moves, key=lambda m: move_key(board, m))
+                    pv = [move] + replies[:1]
+                board.pop()
+                out.write("info depth 1 seldepth 1 multipv %d score %s nodes 20 nps 2000 time 1 pv %s\n"
+                          % (rank, score, " ".join(m.uci() for m in pv)))
+            out.write("bestmove %s\n" % moves[0].uci())
+        elif cmd == "quit":
+            break
+        out.flush()
+
+
+if __name__ == "__main__":
+    main()
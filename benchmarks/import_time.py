@@ -0,0 +1,103 @@
+"""Times the cold import of saulochess.chess_review, the startup cost of every short-lived worker.
+
+    python -m benchmarks.import_time                    # compare with import_baseline.json
+    python -m benchmarks.import_time --update-baseline  # record the current numbers as the baseline
+
+Each import runs in a fresh interpreter with -X importtime; the best of --repeat runs is kept.
+The heavy modules chess_review loads only on first use (LAZY_MODULES) must not be
+imported by the import itself. The exit status is 1 when one of them is, or when the import
+got slower than the baseline by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINE = os.path.join(HERE, 'import_baseline.json')
+
+MODULES = ['saulochess.chess_review']
+
+# chess.pgn imports chess.engine, which imports asyncio
+LAZY_MODULES = ['pandas', 'numpy', 'tqdm', 'IPython', 'chess.engine', 'chess.pgn', 'asyncio']
+
+IMPORTTIME_LINE = re.compile(r'import time:\s*(\d+)\s*\|\s*(\d+)\s*\|\s*(\S+)')
+
+
+def python(*args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, check=True, env=env, cwd=ROOT)
+
+
+def import_microseconds(module):
+    """Cumulative import time of module, in microseconds, in a fresh interpreter."""
+    stderr = python('-X', 'importtime', '-c', f'import {module}').stderr
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and match.group(3) == module:
+            return int(match.group(2))
+    raise RuntimeError(f'{module} not in the -X importtime output')
+
+
+def eager_modules(module):
+    """The LAZY_MODULES that importing module loads anyway."""
+    code = f'import sys, {module}; print(" ".join(name for name in {LAZY_MODULES!r} if name in sys.modules))'
+    return python('-c', code).stdout.split()
+
+
+def measure(module, repeat=7):
+    python('-c', f'import {module}')  # writes the .pyc files, so that no run pays the compilation
+    return {
+        'import_ms': round(min(import_microseconds(module) for _ in range(repeat)) / 1000, 1),
+        'eager_modules': eager_modules(module),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=7, help='imports per module (the fastest one is kept)')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative increase of the import time')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = {}
+    failed = False
+    print(f"{'module':<28} {'import ms':>9}  eager")
+    for module in args.modules:
+        current = results[module] = measure(module, args.repeat)
+        line = f"{module:<28} {current['import_ms']:>9.1f}  {' '.join(current['eager_modules']) or '-'}"
+
+        problems = []
+        if current['eager_modules']:
+            problems.append('imports ' + ', '.join(current['eager_modules']))
+        if not args.update_baseline and module in baseline:
+            previous = baseline[module]['import_ms']
+            if current['import_ms'] > previous * (1 + args.tolerance):
+                problems.append(f"import time {previous} -> {current['import_ms']}")
+        if problems:
+            failed = True
+            line += '  REGRESSION: ' + '; '.join(problems)
+        print(line)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'baseline written to {args.baseline}')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+"""Times saulochess end to end on the corpus, against the scripted engine of fake_uci.py.
+
+    python -m benchmarks.run                    # compare with baseline.json
+    python -m benchmarks.run --update-baseline  # record the current numbers as the baseline
+    python -m benchmarks.run --targets pgn_game_review --games opera immortal
+
+For every target and game it reports the engine calls per ply, the Python time per ply
+(CPU time of this process, which leaves the engine subprocess out; best of --repeat
+runs) and the peak memory allocated by Python (tracemalloc, in a separate run). A digest of the result
+catches changes in the output itself. The exit status is 1 when a result changed or when
+calls, time or memory got worse than the baseline by more than --tolerance.
+"""
+import argparse
+import contextlib
+import functools
+import gc
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import chess
+import chess.engine
+import chess.pgn
+
+from saulochess import chess_review
+from saulochess import instrumentation
+from saulochess.review_cache import review_key
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(HERE, 'corpus.pgn')
+BASELINE = os.path.join(HERE, 'baseline.json')
+FAKE_ENGINE = [sys.executable, os.path.join(HERE, 'fake_uci.py')]
+
+# The scripted engine ignores the limit; it only has to be the same in every run
+DEPTH = 8
+CONFIG = chess_review.AnalysisConfig('depth', depth=DEPTH)
+
+# Plies of each corpus game in the openings table of the opening_review target
+BOOK_PLIES = 8
+
+
+class CountingEngine:
+    """Engine wrapper counting the searches, made with analyse or (with escalation) analysis."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.calls = 0
+
+    def analyse(self, *args, **kwargs):
+        self.calls += 1
+        return self.engine.analyse(*args, **kwargs)
+
+    def analysis(self, *args, **kwargs):
+        self.calls += 1
+        return self.engine.analysis(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.engine, name)
+
+
+class Game:
+    def __init__(self, game):
+        self.name = game.headers.get('Name', game.headers.get('Event', '?'))
+        self.category = game.headers.get('Category', '')
+        self.pgn = str(game.mainline_moves())
+        self.uci_moves, self.san_moves, self.fens = chess_review.replay_moves(game.mainline_moves())
+
+    def __len__(self):
+        return len(self.uci_moves)
+
+
+def load_corpus(path=CORPUS):
+    games = []
+    with open(path, encoding='utf-8') as handle:
+        while True:
+            game = chess.pgn.read_game(handle)
+            if game is None:
+                return games
+            games.append(Game(game))
+
+
+@functools.lru_cache(maxsize=None)
+def corpus_openings():
+    """Openings table holding the first BOOK_PLIES plies of every corpus game.
+
+    As in a sparse table, only the last position of each line is named; the plies
+    before it stay in the book for the CPL (see chess_review.book_plies) but are reviewed.
+    """
+    openings = chess_review.OpeningIndex()
+    for game in load_corpus():
+        openings.add_line(chess.Board().variation_san(game.uci_moves[:BOOK_PLIES]), game.name)
+    return openings
+
+
+def run_pgn_game_review(game, engine):
+    return chess_review.pgn_game_review(game.pgn, False, 'depth', None, DEPTH, engine=engine, language='en', config=CONFIG)
+
+def run_opening_review(game, engine):
+    return chess_review.pgn_game_review(
+        game.pgn, False, 'depth', None, DEPTH, engine=engine, language='en', config=CONFIG, openings_df=corpus_openings()
+    )
+
+def run_review_game(game, engine):
+    with chess_review.using_config(CONFIG):
+        return chess_review.review_game(game.uci_moves, engine=engine, language='en')
+
+def run_compute_cpl(game, engine):
+    with chess_review.using_config(CONFIG):
+        return chess_review.compute_cpl(game.uci_moves, engine)
+
+def run_calculate_metrics(game, engine):
+    return chess_review.calculate_metrics(game.fens)
+
+TARGETS = {
+    'pgn_game_review': run_pgn_game_review,
+    'opening_review': run_opening_review,
+    'review_game': run_review_game,
+    'compute_cpl': run_compute_cpl,
+    'calculate_metrics': run_calculate_metrics,
+}
+
+
+def reset_caches():
+    # every run starts cold: the same searches reach the engine each time
+    chess_review.analysis_cache.clear()
+    chess_review.fork_cache.clear()
+
+
+def result_digest(result):
+    if hasattr(result, 'to_tuple'):
+        result = result.to_tuple()
+    return review_key(result)
+
+
+def run_once(target, game, engine):
+    reset_caches()
+    engine.calls = 0
+    # the warnings printed or logged on the way would only add noise (and time) here
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        result = TARGETS[target](game, engine)
+        cpu = time.process_time() - start_cpu
+        wall = time.perf_counter() - start
+    return result, wall, cpu
+
+
+def measure(target, game, engine, repeat=5):
+    best = None
+    for _ in range(repeat):
+        result, wall, python_seconds = run_once(target, game, engine)
+        if best is None or python_seconds < best[1]:
+            best = (wall, python_seconds, engine.calls, result)
+    wall, python_seconds, calls, result = best
+
+    gc.collect()  # garbage of the previous runs would otherwise be freed at random points of this one
+    tracemalloc.start()
+    try:
+        run_once(target, game, engine)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    plies = len(game)
+    return {
+        'plies': plies,
+        'engine_calls': calls,
+        'engine_calls_per_ply': round(calls / plies, 3),
+        'python_ms_per_ply': round(1000 * python_seconds / plies, 3),
+        'wall_ms': round(1000 * wall, 1),
+        'peak_kib': round(peak / 1024, 1),
+        'digest': result_digest(result),
+    }
+
+
+def compare(current, baseline, tolerance):
+    """Problems of one measurement relative to its baseline entry, as a list of strings."""
+    problems = []
+    if current['digest'] != baseline['digest']:
+        problems.append('result changed')
+    if current['engine_calls'] > baseline['engine_calls']:
+        problems.append(f"engine calls {baseline['engine_calls']} -> {current['engine_calls']}")
+    for name, label in (('python_ms_per_ply', 'python time'), ('peak_kib', 'peak memory')):
+        if current[name] > baseline[name] * (1 + tolerance):
+            problems.append(f'{label} {baseline[name]} -> {current[name]}')
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--targets', nargs='+', choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument('--games', nargs='+', help='names (Name tag) of the corpus games to run')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per measurement (the best one is kept)')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative increase of time and memory')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--engine', nargs='+', default=FAKE_ENGINE, help='engine command (default: the scripted engine)')
+    args = parser.parse_args(argv)
+
+    games = load_corpus()
+    if args.games:
+        games = [game for game in games if game.name in args.games]
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    previous_cache = chess_review.review_cache
+    chess_review.review_cache = None
+    previous_progress = instrumentation.set_progress(None)
+    engine = CountingEngine(chess.engine.SimpleEngine.popen_uci(args.engine))
+    results = {}
+    failed = False
+    try:
+        print(f"{'target':<18} {'game':<18} {'plies':>5} {'calls/ply':>9} {'py ms/ply':>9} {'wall ms':>9} {'peak KiB':>9}")
+        for target in args.targets:
+            for game in games:
+                key = f'{target}/{game.name}'
+                current = results[key] = measure(target, game, engine, args.repeat)
+                line = (f"{target:<18} {game.name:<18} {current['plies']:>5} {current['engine_calls_per_ply']:>9.2f} "
+                        f"{current['python_ms_per_ply']:>9.2f} {current['wall_ms']:>9.1f} {current['peak_kib']:>9.1f}")
+
+                if not args.update_baseline and key in baseline:
+                    problems = compare(current, baseline[key], args.tolerance)
+                    if problems:
+                        failed = True
+                        line += '  REGRESSION: ' + '; '.join(problems)
+                print(line)
+    finally:
+        engine.quit()
+        chess_review.review_cache = previous_cache
+        instrumentation.set_progress(previous_progress)
+
+    if args.update_baseline:
+        if args.games or args.targets != list(TARGETS):
+            # keep the entries that were not measured this time
+            baseline.update(results)
+            results = baseline
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'depth': DEPTH, 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'baseline written to {args.baseline}')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
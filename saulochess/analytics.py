@@ -0,0 +1,123 @@
+import numpy as np
+
+# Same curves as chess_review.calculate_accuracy and chess_review.estimate_elo
+WIN_PERCENT_SLOPE = 0.00368208
+E = 2.71828
+
+
+def pack_scores(score_lists):
+    """Packs per-game score lists into one flat float array plus offsets.
+
+    Game g occupies flat[offsets[g]:offsets[g + 1]].
+    """
+    lengths = np.fromiter((len(scores) for scores in score_lists), dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    flat = np.empty(offsets[-1], dtype=np.float64)
+    for g, scores in enumerate(score_lists):
+        flat[offsets[g]:offsets[g + 1]] = scores
+    return flat, offsets
+
+
+def ply_layout(offsets):
+    """Game index and ply number inside its game for every entry of the flat array."""
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    game = np.repeat(np.arange(len(lengths)), lengths)
+    ply = np.arange(offsets[-1]) - offsets[:-1][game]
+    return game, ply
+
+
+def previous_scores(flat, offsets, initial=0.0):
+    """Score before each move: the previous entry of the same game, or `initial` on its first ply.
+
+    initial is a scalar or one value per game (the evaluation of the starting position).
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    previous = np.empty_like(flat)
+    previous[1:] = flat[:-1]
+
+    starts = offsets[:-1][np.diff(offsets) > 0]
+    initial = np.broadcast_to(np.asarray(initial, dtype=np.float64), (len(offsets) - 1,))
+    previous[starts] = initial[np.diff(offsets) > 0]
+    return previous
+
+
+def side_means(values, game, ply, n_games):
+    """Mean of values per game and side, as (white, black) arrays; nan where a side has no moves."""
+    side = game * 2 + (ply % 2)
+    sums = np.bincount(side, weights=values, minlength=2 * n_games)
+    counts = np.bincount(side, minlength=2 * n_games)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    return means[0::2], means[1::2]
+
+
+def win_percentages(scores):
+    """White's win percentage for centipawn scores from White's point of view."""
+    return 50 + 50 * (2 / (1 + np.exp(-WIN_PERCENT_SLOPE * np.asarray(scores, dtype=np.float64))) - 1)
+
+
+def move_accuracies(flat, offsets, initial=0.0):
+    """Accuracy of every move, with the game starting from the `initial` evaluation (see previous_scores)."""
+    flat = np.asarray(flat, dtype=np.float64)
+    _, ply = ply_layout(offsets)
+
+    win_after = win_percentages(flat)
+    win_before = win_percentages(previous_scores(flat, offsets, initial))
+    # White loses win% when it goes down, Black when it goes up
+    win_delta = np.where(ply % 2 == 0, win_before - win_after, win_after - win_before)
+
+    accuracies = 100.0307234 * np.exp(-0.1008298 * win_delta) - 0.03076726
+    return np.where(win_delta <= 0, 100.0, accuracies)
+
+
+def batch_accuracy(flat, offsets, initial=0.0):
+    """Per-game (white, black) accuracy arrays."""
+    game, ply = ply_layout(offsets)
+    return side_means(move_accuracies(flat, offsets, initial), game, ply, len(offsets) - 1)
+
+
+def batch_cpl(flat, offsets, initial=0.0):
+    """Centipawn loss of every move, as |score before the move - score after it|."""
+    flat = np.asarray(flat, dtype=np.float64)
+    return np.abs(previous_scores(flat, offsets, initial) - flat)
+
+
+def batch_acpl(flat, offsets, initial=0.0):
+    """Per-game (white, black) average centipawn loss arrays."""
+    game, ply = ply_layout(offsets)
+    return side_means(batch_cpl(flat, offsets, initial), game, ply, len(offsets) - 1)
+
+
+def batch_elo(acpl, n_moves):
+    """Vectorized estimate_elo: an Elo estimate per (acpl, n_moves) pair, nan where acpl is nan."""
+    acpl = np.asarray(acpl, dtype=np.float64)
+    n_moves = np.asarray(n_moves, dtype=np.float64)
+
+    estimate = 3000 * (E ** (-0.01 * acpl)) * ((n_moves / 50) ** 0.5)
+    return np.where(acpl > 500, 100.0, np.ceil(estimate / 100) * 100)
+
+
+def batch_metrics(flat, offsets, initial=0.0):
+    """Accuracy, ACPL and Elo estimates for every game of a packed batch (see pack_scores).
+
+    Returns a dict of per-game arrays, ready for pandas.DataFrame.
+    """
+    flat = np.asarray(flat, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_moves = np.diff(offsets) // 2
+
+    white_acc, black_acc = batch_accuracy(flat, offsets, initial)
+    white_acpl, black_acpl = batch_acpl(flat, offsets, initial)
+
+    return {
+        'n_moves': n_moves,
+        'white_accuracy': white_acc,
+        'black_accuracy': black_acc,
+        'white_acpl': white_acpl,
+        'black_acpl': black_acpl,
+        'white_elo': batch_elo(white_acpl, n_moves),
+        'black_elo': batch_elo(black_acpl, n_moves),
+    }
@@ -0,0 +1,331 @@
+import asyncio
+import time
+import weakref
+
+import chess
+import chess.engine
+
+from saulochess import chess_review
+from saulochess import instrumentation
+
+# One protocol can only run one command at a time: a new command cancels the
+# running one, so every search on a protocol goes through its lock.
+protocol_locks = weakref.WeakKeyDictionary()
+
+
+class PendingAnalysis(BaseException):
+    """Raised by ReplayEngine when the synchronous review needs a position that has not been searched yet.
+
+    It derives from BaseException so the `except Exception` blocks of review_ply do not swallow it.
+    """
+
+    def __init__(self, board, multipv=None, root_moves=None, config=None):
+        super().__init__(board.fen())
+        self.board = board.copy()
+        self.multipv = multipv
+        self.root_moves = root_moves
+        # the config active where the search was asked for (classify_move may escalate it)
+        self.config = config
+
+
+class ReplayEngine:
+    """Synchronous engine stand-in that only answers positions already searched by the async driver."""
+
+    # its answers are searches already reported by search_async
+    replay = True
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.id = protocol.id
+        self.resolved = {}
+
+    def analyse(self, board, limit, multipv=None, root_moves=None, **kwargs):
+        key = chess_review.analysis_key(board, self, multipv, root_moves)
+        if key in self.resolved:
+            return self.resolved[key]
+        raise PendingAnalysis(board, multipv, root_moves, chess_review.active_config())
+
+
+async def search_async(board, protocol, config, multipv=None, root_moves=None):
+    # Async counterpart of chess_review.search
+    instruments = instrumentation.active_instrumentation()
+    if instruments is None:
+        return await engine_search_async(board, protocol, config, multipv, root_moves)
+
+    start = time.perf_counter()
+    try:
+        result = await engine_search_async(board, protocol, config, multipv, root_moves)
+    except Exception as e:
+        instruments.error('engine', e, engine=chess_review.engine_name(protocol), fen=board.fen())
+        raise
+    chess_review.record_engine_call(instruments, protocol, time.perf_counter() - start, result)
+    return result
+
+
+async def engine_search_async(board, protocol, config, multipv=None, root_moves=None):
+    options = chess_review.search_options(multipv, root_moves, config)
+    if config.escalation is None:
+        return await protocol.analyse(board, config.limit(), **options)
+
+    depth_scores = {}
+    with await protocol.analysis(board, config.limit(), **options) as analysis:
+        async for info in analysis:
+            chess_review.record_depth_score(depth_scores, info)
+    return chess_review.attach_depth_scores(analysis.info if multipv is None else analysis.multipv, depth_scores)
+
+
+async def analyse_position_async(board, protocol, multipv=None, root_moves=None, config=None):
+    """Async counterpart of chess_review.analyse_position, sharing analysis_cache with it."""
+    config = chess_review.active_config(config)
+    info = chess_review.cached_analysis(board, protocol, multipv, root_moves, config)
+    if info is None:
+        lock = protocol_locks.setdefault(protocol, asyncio.Lock())
+        async with lock:
+            info = await search_async(board, protocol, config, multipv, root_moves)
+        chess_review.store_analysis(board, protocol, info, multipv, root_moves, config)
+    return info
+
+
+async def resolve(protocol, func, *args, **kwargs):
+    """Runs a synchronous chess_review function, awaiting every search it needs.
+
+    The function is replayed after each missing search until all of its searches
+    are available, so no thread ever blocks on the engine.
+    """
+    engine = ReplayEngine(protocol)
+    while True:
+        try:
+            return func(*args, engine=engine, **kwargs)
+        except PendingAnalysis as pending:
+            info = await analyse_position_async(pending.board, protocol, pending.multipv, pending.root_moves, pending.config)
+            key = chess_review.analysis_key(pending.board, engine, pending.multipv, pending.root_moves, pending.config)
+            engine.resolved[key] = info
+
+
+async def prefetch(protocol, board, move, multipv=None):
+    # As duas buscas que toda review faz: antes e depois do lance
+    await analyse_position_async(board, protocol, multipv)
+    position_after_move = board.copy()
+    position_after_move.push(move)
+    await analyse_position_async(position_after_move, protocol, multipv)
+
+
+async def review_move_async(board: chess.Board, move, previous_review: str, check_if_opening=False, protocol=None, openings_df=None, language='en', multipv=None):
+    if protocol is None:
+        raise ValueError("O protocolo (protocol) deve ser passado para review_move_async.")
+
+    position_after_move = board.copy()
+    position_after_move.push(move)
+    if not (check_if_opening and chess_review.book_opening(position_after_move, openings_df)):
+        await prefetch(protocol, board, move, multipv)
+    return await resolve(
+        protocol, chess_review.review_move, board, move, previous_review, check_if_opening,
+        openings_df=openings_df, language=language, multipv=multipv
+    )
+
+
+async def review_game_async(uci_moves, roast=False, verbose=False, protocol=None, language=None, multipv=None, openings_df=None):
+    if protocol is None:
+        raise ValueError("O protocolo (protocol) deve ser passado para review_game_async.")
+
+    board = chess.Board()
+
+    san_best_moves = []
+    uci_best_moves = []
+    classification_list = []
+    review_list = []
+    best_review_list = []
+
+    for i, move in enumerate(uci_moves):
+
+        if len(review_list) == 0:
+            previous_review = None
+        else:
+            previous_review = review_list[-1]
+
+        # os lances de livro não são buscados
+        position_after_move = board.copy()
+        position_after_move.push(move)
+        if not chess_review.is_book_ply(position_after_move, i, openings_df):
+            await prefetch(protocol, board, move, multipv)
+        classification, review, best_review, uci_best_move, san_best_move = await resolve(
+            protocol, chess_review.review_ply, board, move, i, previous_review, roast, language=language, multipv=multipv,
+            openings_df=openings_df
+        )
+
+        classification_list.append(classification)
+        review_list.append(review)
+        best_review_list.append(best_review)
+        uci_best_moves.append(uci_best_move)
+        san_best_moves.append(san_best_move)
+
+        if verbose:
+            chess_review.print_verbose_ply(move, review, uci_best_move, best_review)
+
+        board.push(move)
+
+    return review_list, best_review_list, classification_list, uci_best_moves, san_best_moves
+
+
+async def analyse_game_async(uci_moves, roast=False, verbose=False, protocol=None, language=None, multipv=None, openings_df=None):
+    """Async counterpart of chess_review.analyse_game."""
+    if protocol is None:
+        raise ValueError("O protocolo (protocol) deve ser passado para analyse_game_async.")
+
+    board = chess.Board()
+
+    scores = []
+    cpls_white = []
+    cpls_black = []
+    san_best_moves = []
+    uci_best_moves = []
+    classification_list = []
+    review_list = []
+    best_review_list = []
+    devs = []
+    mobs = []
+    tens = []
+    conts = []
+
+    # os lances do começo que seguem o livro não são buscados para o CPL: todos ficam com o score da posição onde o livro acaba
+    book = chess_review.book_plies(uci_moves, openings_df)
+    book_end = chess_review.book_position(uci_moves, book)
+    score_best = await resolve(protocol, chess_review.evaluate_for_cpl, book_end, multipv=multipv)
+
+    for i, move in enumerate(uci_moves):
+
+        if len(review_list) == 0:
+            previous_review = None
+        else:
+            previous_review = review_list[-1]
+
+        position_after_move = board.copy()
+        position_after_move.push(move)
+        if not chess_review.is_book_ply(position_after_move, i, openings_df):
+            await prefetch(protocol, board, move, multipv)
+        classification, review, best_review, uci_best_move, san_best_move = await resolve(
+            protocol, chess_review.review_ply, board, move, i, previous_review, roast, language=language, multipv=multipv,
+            openings_df=openings_df
+        )
+
+        classification_list.append(classification)
+        review_list.append(review)
+        best_review_list.append(best_review)
+        uci_best_moves.append(uci_best_move)
+        san_best_moves.append(san_best_move)
+
+        if verbose:
+            chess_review.print_verbose_ply(move, review, uci_best_move, best_review)
+
+        board.push(move)
+        if i < book:
+            score_player = score_best
+        else:
+            score_player = await resolve(protocol, chess_review.evaluate_for_cpl, board, multipv=multipv)
+        scores.append(score_player)
+
+        dev, mob, ten, cont = chess_review.position_metrics(board)
+        devs.append(dev)
+        mobs.append(mob)
+        tens.append(ten)
+        conts.append(cont)
+
+        if i%2 == 0:
+            cpls_white.append(abs(score_best - score_player))
+        else:
+            cpls_black.append(abs(score_best - score_player))
+
+        score_best = score_player
+
+    average_cpl_white = sum(cpls_white)/len(cpls_white)
+    average_cpl_black = sum(cpls_black)/len(cpls_black)
+
+    return (
+        scores, cpls_white, cpls_black, average_cpl_white, average_cpl_black,
+        review_list, best_review_list, classification_list, uci_best_moves, san_best_moves,
+        (devs, mobs, tens, conts)
+    )
+
+
+async def pgn_game_review_async(pgn_data: str, roast: bool, limit_type: str, time_limit: float, depth_limit: int, protocol=None, language='en', multipv=None, openings_df=None, config=None):
+    """Async counterpart of chess_review.pgn_game_review, driving a chess.engine.UciProtocol.
+
+    When protocol is None a Stockfish process is opened with chess.engine.popen_uci and
+    closed at the end of the review. The AnalysisConfig is only active in the calling task,
+    so reviews gathered on one event loop can use different limits.
+    """
+    if config is None:
+        config = chess_review.AnalysisConfig.from_limits(limit_type, time_limit, depth_limit, multipv=multipv)
+
+    uci_moves, san_moves, fens = chess_review.parse_pgn(pgn_data)
+
+    cache = chess_review.review_cache
+    if cache is not None:
+        key = chess_review.review_cache_key(uci_moves, roast, config, protocol, language, openings_df)
+        cached = cache.get(key)
+        if cached is not None:
+            cached.cache_key = key
+            return cached
+
+    with chess_review.using_config(config):
+        result = await review_parsed_game_async(uci_moves, fens, roast, protocol, language, config.multipv, openings_df)
+
+    if cache is not None and not result.failed:
+        cache.put(key, result)
+        result.cache_key = key
+    return result
+
+
+async def review_parsed_game_async(uci_moves, fens, roast, protocol, language, multipv, openings_df):
+    # Corpo de pgn_game_review_async, rodando com a AnalysisConfig já ativa
+    local_protocol = protocol
+    should_close_engine = False
+
+    if local_protocol is None:
+        try:
+            _, local_protocol = await chess.engine.popen_uci(chess_review.stockfish_path)
+            should_close_engine = True
+        except Exception as e:
+            print(f"Erro Crítico ao abrir o Stockfish em {chess_review.stockfish_path}: {e}")
+            chess_review.report_error('engine_open', e, path=chess_review.stockfish_path)
+            raise e
+
+    # engine_options valem para a revisão inteira (ver chess_review.configure_engine)
+    options = chess_review.active_config().engine_options
+    previous_options = {}
+
+    try:
+        if options:
+            previous_options = chess_review.previous_engine_options(local_protocol, options)
+            await local_protocol.configure(dict(options))
+
+        (
+            scores, cpls_white, cpls_black, average_cpl_white, average_cpl_black,
+            review_list, best_review_list, classification_list, uci_best_moves, san_best_moves, metrics
+        ) = await analyse_game_async(
+            uci_moves,
+            roast,
+            protocol=local_protocol,
+            language=language,
+            multipv=multipv,
+            openings_df=openings_df
+        )
+
+    except Exception as e:
+        print(f"Erro na análise do Stockfish: {e}")
+        chess_review.report_error('review', e, plies=len(uci_moves))
+
+        from saulochess.review_result import GameReview
+        return GameReview.from_failure(uci_moves)
+
+    finally:
+        if should_close_engine:
+            await local_protocol.quit()
+        elif previous_options:
+            await local_protocol.configure(previous_options)
+
+    return chess_review.summarize_game_review(
+        uci_moves, fens, scores, average_cpl_white, average_cpl_black,
+        review_list, best_review_list, classification_list, uci_best_moves, metrics,
+        chess_review.opening_score(scores, uci_moves, openings_df)
+    )
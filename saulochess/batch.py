@@ -0,0 +1,229 @@
+import os
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import util
+
+import chess.pgn
+
+from saulochess import chess_review
+from saulochess import engine_pool
+
+# Pool of one engine owned by the current worker process, opened once by init_worker.
+# Each game leases the engine, which is pinged first and reopened if Stockfish died.
+worker_pool = None
+# OpeningIndex received once per worker, shared by all its games.
+worker_openings = None
+
+
+class ReviewFailure:
+    """Result placeholder for a game whose review raised inside a worker."""
+
+    def __init__(self, index, error, details=''):
+        self.index = index
+        self.error = error
+        self.details = details
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return f'ReviewFailure(index={self.index}, error={self.error!r})'
+
+
+def init_worker(engine_path, engine_options, eval_store_path=None, openings=None):
+    global worker_pool
+    global worker_openings
+
+    worker_openings = openings
+
+    if eval_store_path is not None:
+        chess_review.open_eval_store(eval_store_path)
+
+    worker_pool = engine_pool.EnginePool(engine_path, size=1, options=engine_options, idle_timeout=None)
+
+    # Fecha o motor quando o processo do worker terminar
+    util.Finalize(None, worker_pool.close, exitpriority=10)
+
+
+def review_one(index, pgn_data, roast, limit_type, time_limit, depth_limit, language):
+    try:
+        with worker_pool.lease() as engine:
+            result = chess_review.pgn_game_review(
+                pgn_data, roast, limit_type, time_limit, depth_limit,
+                engine=engine, language=language, openings_df=worker_openings
+            )
+    except Exception as e:
+        return index, ReviewFailure(index, str(e), traceback.format_exc())
+    return index, result
+
+
+def review_moves_one(index, uci_moves, roast, limit_type, time_limit, depth_limit, language):
+    # Partidas lidas de um arquivo: não passam pelo review_cache de pgn_game_review
+    try:
+        uci_moves, san_moves, fens = chess_review.replay_moves(uci_moves)
+        with worker_pool.lease() as engine:
+            result = chess_review.review_parsed_game(
+                uci_moves, san_moves, fens, roast, limit_type, time_limit, depth_limit,
+                engine=engine, language=language, openings_df=worker_openings
+            )
+    except Exception as e:
+        return index, ReviewFailure(index, str(e), traceback.format_exc())
+    return index, result
+
+
+def read_games(handle):
+    """Yields the games of an open PGN file one at a time, as (headers, UCI move list)."""
+    while True:
+        game = chess.pgn.read_game(handle)
+        if game is None:
+            return
+        yield dict(game.headers), [move.uci() for move in game.mainline_moves()]
+
+
+def run_in_workers(function, tasks, workers, initargs, ordered=False, max_pending=None, retries=2):
+    """Runs function(index, *args) for each (index, args) of tasks on worker processes,
+    yielding (index, result) pairs (in index order when ordered).
+
+    At most max_pending tasks (None: all of them) are taken from tasks ahead of the consumer.
+    When a worker process dies the ProcessPoolExecutor is broken and every task it had not
+    finished fails with it: the executor is recreated and those tasks are submitted again, up
+    to `retries` times each, before they yield a ReviewFailure.
+    """
+    def new_executor():
+        return ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs)
+
+    executor = new_executor()
+    pending = {}  # future -> (index, args, attempts, executor that ran it)
+
+    def submit(index, args, attempts):
+        nonlocal executor
+        try:
+            future = executor.submit(function, index, *args)
+        except BrokenProcessPool:
+            # um executor quebrado já falhou todas as suas tarefas: não há o que cancelar
+            executor.shutdown(wait=False)
+            executor = new_executor()
+            future = executor.submit(function, index, *args)
+        pending[future] = (index, args, attempts, executor)
+
+    tasks = iter(tasks)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and (max_pending is None or len(pending) < max_pending):
+                try:
+                    index, args = next(tasks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                submit(index, args, 0)
+
+            if not pending:
+                break
+
+            if ordered:
+                # a task submitted again keeps its place: the next one is always the lowest index
+                future = min(pending, key=lambda f: pending[f][0])
+                wait([future])
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                future = min(done, key=lambda f: pending[f][0])
+
+            index, args, attempts, ran_on = pending.pop(future)
+            try:
+                yield future.result()
+            except BrokenProcessPool as e:
+                # O processo de um worker morreu: as tarefas que ele levou junto voltam para um executor novo
+                if ran_on is executor:
+                    executor.shutdown(wait=False)
+                    executor = new_executor()
+                if attempts < retries:
+                    submit(index, args, attempts + 1)
+                else:
+                    yield index, ReviewFailure(index, str(e), traceback.format_exc())
+            except Exception as e:
+                yield index, ReviewFailure(index, str(e), traceback.format_exc())
+    finally:
+        # shutdown(cancel_futures=True) só existe a partir do Python 3.9
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def iter_review_games(pgns, workers=None, roast=False, limit_type='depth', time_limit=0.2, depth_limit=10,
+                      language='en', engine_path=None, engine_options=None, ordered=False, eval_store_path=None, openings=None,
+                      retries=2):
+    """Reviews many PGN strings on `workers` processes, yielding (index, result) pairs.
+
+    Each worker opens its own engine once and keeps it warm for every game it receives;
+    the engine is reopened if it dies. With ordered=False pairs are yielded as games finish,
+    otherwise in input order. A game whose review raises yields a ReviewFailure instead of the
+    18-tuple. When a worker process dies, the games it took down are reviewed again on a new
+    set of workers, up to `retries` times (see run_in_workers).
+    With eval_store_path every worker shares the memory-mapped evaluation store at that path.
+    openings (an OpeningIndex or an openings DataFrame) is compiled once and sent once to each worker.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if engine_path is None:
+        engine_path = chess_review.stockfish_path
+    openings = chess_review.opening_index(openings)
+
+    tasks = (
+        (index, (pgn_data, roast, limit_type, time_limit, depth_limit, language))
+        for index, pgn_data in enumerate(pgns)
+    )
+    yield from run_in_workers(review_one, tasks, workers, (engine_path, engine_options, eval_store_path, openings),
+                              ordered=ordered, retries=retries)
+
+
+def review_games(pgns, workers=None, roast=False, limit_type='depth', time_limit=0.2, depth_limit=10,
+                 language='en', engine_path=None, engine_options=None, eval_store_path=None, openings=None, retries=2):
+    """Reviews many PGN strings in parallel and returns their results in input order."""
+    pgns = list(pgns)
+    results = [None] * len(pgns)
+    for index, result in iter_review_games(pgns, workers, roast, limit_type, time_limit, depth_limit,
+                                           language, engine_path, engine_options, ordered=True,
+                                           eval_store_path=eval_store_path, openings=openings, retries=retries):
+        results[index] = result
+    return results
+
+
+def iter_review_pgn_file(path, workers=None, roast=False, limit_type='depth', time_limit=0.2, depth_limit=10,
+                         language='en', engine_path=None, engine_options=None, ordered=True, eval_store_path=None,
+                         openings=None, max_pending=None, encoding='utf-8', retries=2):
+    """Reviews every game of a PGN file, yielding (index, headers, result) triples.
+
+    Games are read lazily with chess.pgn.read_game and at most `max_pending` (default:
+    twice the number of workers) are read ahead of the consumer, so memory stays flat
+    whatever the size of the file and a slow consumer slows down the reading.
+    If a worker process dies, the games it took down are reviewed again (see run_in_workers)
+    and the file keeps being read.
+    path may also be an open text file. The other arguments are those of iter_review_games.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 2 * workers
+    if engine_path is None:
+        engine_path = chess_review.stockfish_path
+    openings = chess_review.opening_index(openings)
+
+    handle = path if hasattr(path, 'read') else open(path, encoding=encoding)
+    try:
+        # os cabeçalhos ficam aqui, só as jogadas vão para os workers
+        pending_headers = {}
+
+        def tasks():
+            for index, (headers, uci_moves) in enumerate(read_games(handle)):
+                pending_headers[index] = headers
+                yield index, (uci_moves, roast, limit_type, time_limit, depth_limit, language)
+
+        for index, result in run_in_workers(review_moves_one, tasks(), workers,
+                                            (engine_path, engine_options, eval_store_path, openings),
+                                            ordered=ordered, max_pending=max_pending, retries=retries):
+            yield index, pending_headers.pop(index), result
+    finally:
+        if handle is not path:
+            handle.close()
@@ -1,36 +1,538 @@
-import chess.engine  
-from IPython.display import clear_output
+# Só o chess é importado aqui: chess.engine/chess.pgn (que trazem o asyncio), numpy e pandas
+# são importados onde são usados, para que importar este módulo seja rápido
+import chess
 import time
-import pandas as pd
 import re
-import chess.pgn
+import chess.polyglot
+import threading
+import weakref
+import queue
+import contextvars
+import functools
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from collections import Counter # for calculating captured pieces
 import math
-import numpy as np
 import io
-from tqdm import tqdm
+import pickle
 import platform
-from functools import lru_cache
+from saulochess import instrumentation
+from saulochess.review_cache import ReviewCache, review_key
 
 stockfish_path = "stockfish"
 if "windows" in platform.system().lower():
     stockfish_path += ".exe"
 
+# Limite padrão, usado quando nenhuma AnalysisConfig está ativa (ver active_config)
 STOCKFISH_CONFIG = {"time": 0.01}
 
 openings_df = None
 # only 2 openings have more than 12 moves
 
 
+class LRUCache:
+    """Bounded least-recently-used mapping with hit/miss counters."""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+# Engine results shared by every helper below, so that each distinct position
+# is only searched once per (engine, limit).
+analysis_cache = LRUCache(maxsize=8192)
+
+# Optional on-disk store (eval_store.EvalStore) consulted after analysis_cache, see open_eval_store.
+eval_store = None
+
+
+def open_eval_store(path, capacity=1 << 20):
+    """Opens (or creates) a memory-mapped evaluation store shared by every review in this host."""
+    global eval_store
+    from saulochess.eval_store import EvalStore
+
+    eval_store = EvalStore(path, capacity)
+    return eval_store
+
+
+# Quando a review do melhor lance é escrita (AnalysisConfig.best_reviews)
+BEST_REVIEW_MODES = ('eager', 'lazy', 'off')
+
+
+@dataclass(frozen=True)
+class AnalysisConfig:
+    """Settings of one review: search limit, MultiPV, engine options and detector profile.
+
+    pgn_game_review builds one per call and makes it active for the whole review
+    (see using_config), so concurrent reviews in threads or asyncio tasks can use
+    different limits. engine_options are set on each engine once at the start of the
+    review and restored at its end (see configure_engine), not sent with every search.
+
+    With escalation (another AnalysisConfig, normally with a higher limit) classify_move
+    re-searches a ply at the escalation limits when its centipawn loss is within
+    escalation_margin of a bucket boundary, or when the score of a search moved by more
+    than instability_margin between its last two depths. That swing is kept with the analysis
+    (also in the eval store); when it is unknown, because the search was made without
+    escalation or comes from an older eval store file, only the boundary margin decides.
+
+    detectors is the profile of the review_move detectors (see DETECTOR_PROFILES): 'fast'
+    skips those that scan every legal move or need extra engine searches.
+
+    best_reviews says when the review of the engine's best move is written: 'eager' with the
+    review of each ply, 'lazy' only when asked for (GameReview.best_review), or 'off'.
+    """
+    limit_type: str = 'time'
+    depth: int = None
+    time: float = None
+    nodes: int = None
+    multipv: int = None
+    engine_options: tuple = ()
+    escalation: 'AnalysisConfig' = None
+    escalation_margin: int = 25
+    instability_margin: int = 60
+    detectors: str = 'full'
+    best_reviews: str = 'eager'
+
+    def __post_init__(self):
+        if self.best_reviews not in BEST_REVIEW_MODES:
+            raise ValueError(f"best_reviews desconhecido: {self.best_reviews!r}. Use um de {list(BEST_REVIEW_MODES)}.")
+        if isinstance(self.engine_options, dict):
+            object.__setattr__(self, 'engine_options', tuple(sorted(self.engine_options.items())))
+
+    @classmethod
+    def from_limits(cls, limit_type, time_limit=None, depth_limit=None, nodes_limit=None, multipv=None, engine_options=()):
+        # Same rule as pgn_game_review: 'time' and 'nodes' select those limits, anything else is a depth limit
+        if limit_type == 'time':
+            return cls('time', time=float(time_limit), multipv=multipv, engine_options=engine_options)
+        elif limit_type == 'nodes':
+            return cls('nodes', nodes=int(nodes_limit), multipv=multipv, engine_options=engine_options)
+        return cls('depth', depth=int(depth_limit), multipv=multipv, engine_options=engine_options)
+
+    @classmethod
+    def from_dict(cls, limits):
+        # a dict in the STOCKFISH_CONFIG format, e.g. {"time": 0.01}
+        limit_type = next((name for name in ('time', 'depth', 'nodes') if name in limits), 'time')
+        return cls(limit_type, depth=limits.get('depth'), time=limits.get('time'), nodes=limits.get('nodes'))
+
+    def limits(self):
+        return {name: value for name, value in (('time', self.time), ('depth', self.depth), ('nodes', self.nodes))
+                if value is not None}
+
+    def limit(self):
+        import chess.engine
+        return chess.engine.Limit(**self.limits())
+
+    def key(self):
+        # same format as the old tuple(sorted(STOCKFISH_CONFIG.items())), plus the options when there are any
+        key = tuple(sorted(self.limits().items()))
+        if self.engine_options:
+            key += (self.engine_options,)
+        return key
+
+    def review_key(self):
+        # key() identifies one search; a review also depends on the escalation settings and detectors
+        key = self.key()
+        if self.escalation is not None:
+            key += (('escalation', self.escalation.key(), self.escalation_margin, self.instability_margin),)
+        if self.detectors != 'full':
+            key += (('detectors', self.detectors),)
+        if self.best_reviews != 'eager':
+            key += (('best_reviews', self.best_reviews),)
+        return key
+
+    def escalated(self):
+        """This config with the limits of its escalation (and no further escalation)."""
+        deep = self.escalation
+        return replace(self, limit_type=deep.limit_type, depth=deep.depth, time=deep.time, nodes=deep.nodes, escalation=None)
+
+
+# AnalysisConfig of the review running in the current thread or asyncio task
+current_config = contextvars.ContextVar('current_config', default=None)
+
+
+def active_config(config=None):
+    if config is not None:
+        return config
+    config = current_config.get()
+    if config is None:
+        config = AnalysisConfig.from_dict(STOCKFISH_CONFIG)
+    return config
+
+
+@contextmanager
+def using_config(config):
+    """Makes config the active AnalysisConfig of every search inside the block."""
+    token = current_config.set(config)
+    try:
+        yield config
+    finally:
+        current_config.reset(token)
+
+
+def engine_name(engine):
+    try:
+        return engine.id.get('name', type(engine).__name__)
+    except AttributeError:
+        return type(engine).__name__
+
+
+def engine_identity(engine):
+    # nome e opções configuradas do motor; sem motor, o do pool padrão (Stockfish em stockfish_path)
+    if engine is None:
+        from saulochess import engine_pool
+        return engine_pool.default_identity()
+    config = getattr(getattr(engine, 'protocol', engine), 'config', None) or {}
+    return engine_name(engine), tuple(sorted((str(name), repr(value)) for name, value in config.items()))
+
+def analysis_key(board, engine, multipv=None, root_moves=None, config=None):
+    # o mesmo motor que nas chaves do review_cache: mesmo nome com outras opções (Skill Level, EvalFile...) é outro motor
+    key = (chess.polyglot.zobrist_hash(board), active_config(config).key(), engine_identity(engine))
+    if (multipv is not None) or root_moves:
+        key += (multipv, tuple(m.uci() for m in root_moves) if root_moves else None)
+    return key
+
+
+def cached_analysis(board, engine, multipv=None, root_moves=None, config=None):
+    key = analysis_key(board, engine, multipv, root_moves, config)
+    info = analysis_cache.get(key)
+
+    if (info is None) and (eval_store is not None) and (multipv is None) and (not root_moves):
+        info = eval_store.get(board, key[1:])
+        if info is not None:
+            analysis_cache.put(key, info)
+
+    return info
+
+
+def store_analysis(board, engine, info, multipv=None, root_moves=None, config=None):
+    key = analysis_key(board, engine, multipv, root_moves, config)
+    analysis_cache.put(key, info)
+
+    if (eval_store is not None) and (multipv is None) and (not root_moves):
+        eval_store.put(board, key[1:], info)
+
+    # A MultiPV search also answers later single-line requests for the same board,
+    # in this process and, through eval_store, in the others
+    if multipv is not None and not root_moves and len(info) > 0:
+        single_key = analysis_key(board, engine, config=config)
+        if single_key not in analysis_cache:
+            analysis_cache.put(single_key, info[0])
+            if eval_store is not None:
+                eval_store.put(board, single_key[1:], info[0])
+
+
+def search_options(multipv=None, root_moves=None, config=None):
+    # keyword arguments of engine.analyse besides the limit
+    options = {}
+    if (multipv is not None) or root_moves:
+        options['multipv'] = multipv
+        options['root_moves'] = root_moves
+    return options
+
+
+def configure_engine(engine, options):
+    """Sets UCI options (AnalysisConfig.engine_options) on the engine for a whole review.
+
+    Per-search options would make python-chess send setoption whenever they differ from the
+    previous search's, and Stockfish reallocates its hash or restarts its threads each time.
+    Returns the previous values, to give back with engine.configure at the end of the review.
+    """
+    if not options:
+        return {}
+    previous = previous_engine_options(engine, options)
+    engine.configure(dict(options))
+    return previous
+
+
+def previous_engine_options(engine, options):
+    # valores atuais (ou padrão) das opções que a revisão vai mudar
+    current = getattr(getattr(engine, 'protocol', engine), 'config', None) or {}
+    previous = {}
+    for name in dict(options):
+        value = current.get(name)
+        if value is None and name in engine.options:
+            value = engine.options[name].default
+        if value is not None:
+            previous[name] = value
+    return previous
+
+
+def record_depth_score(depth_scores, info):
+    # score of the main line at each depth, from the engine's intermediate info
+    if info.get('multipv', 1) == 1 and 'score' in info and 'depth' in info:
+        depth_scores[info['depth']] = info['score']
+
+def attach_depth_scores(result, depth_scores):
+    first = result[0] if isinstance(result, list) else result
+    if first is not None:
+        first['depth_scores'] = depth_scores
+        # o que needs_escalation usa, guardado também no eval_store (depth_scores não vai para o disco)
+        if len(depth_scores) >= 2:
+            previous_depth, last_depth = sorted(depth_scores)[-2:]
+            previous = depth_scores[previous_depth].relative.score(mate_score=10000)
+            last = depth_scores[last_depth].relative.score(mate_score=10000)
+            first['depth_swing'] = abs(last - previous)
+    return result
+
+def record_engine_call(instruments, engine, seconds, result):
+    # result is an info dict, or a list of them with MultiPV
+    info = result[0] if isinstance(result, list) and result else result
+    instruments.engine_call(engine_name(engine), seconds, info if isinstance(info, dict) else None)
+
+def search(board, engine, config, multipv=None, root_moves=None):
+    """engine_search, reported to the active Instrumentation when there is one."""
+    instruments = instrumentation.active_instrumentation()
+    # ReplayEngine (async_review) only hands back searches already made and reported
+    if instruments is None or getattr(engine, 'replay', False):
+        return engine_search(board, engine, config, multipv, root_moves)
+
+    start = time.perf_counter()
+    try:
+        result = engine_search(board, engine, config, multipv, root_moves)
+    except Exception as e:
+        instruments.error('engine', e, engine=engine_name(engine), fen=board.fen())
+        raise
+    record_engine_call(instruments, engine, time.perf_counter() - start, result)
+    return result
+
+def engine_search(board, engine, config, multipv=None, root_moves=None):
+    options = search_options(multipv, root_moves, config)
+
+    # With depth escalation the intermediate scores are kept to tell unstable searches apart
+    if config.escalation is None or not hasattr(engine, 'analysis'):
+        return engine.analyse(board, config.limit(), **options)
+
+    depth_scores = {}
+    with engine.analysis(board, config.limit(), **options) as analysis:
+        for info in analysis:
+            record_depth_score(depth_scores, info)
+    return attach_depth_scores(analysis.info if multipv is None else analysis.multipv, depth_scores)
+
+def analyse_position(board, engine, multipv=None, root_moves=None, config=None):
+    """Runs engine.analyse on the board with the active limit, consulting analysis_cache first.
+
+    With multipv the list of lines is returned; with root_moves the search is restricted to those moves.
+    config defaults to the active AnalysisConfig (see active_config).
+    """
+    config = active_config(config)
+    info = cached_analysis(board, engine, multipv, root_moves, config)
+    if info is None:
+        info = search(board, engine, config, multipv, root_moves)
+        store_analysis(board, engine, info, multipv, root_moves, config)
+    return info
+
+
+
+class OpeningIndex:
+    """Openings table compiled into a dict keyed by the Zobrist hash of each line's final position.
+
+    Every line is replayed move by move when the index is built, so a lookup is a single
+    dict access and also finds games that transpose into a known line. The hashes of every
+    position along the lines, not only the final ones, are kept in line_positions (see book_plies).
+    """
+
+    def __init__(self):
+        self.positions = {}
+        self.line_positions = set()
+        self._fingerprint = None
+
+    @classmethod
+    def from_dataframe(cls, dataframe):
+        # Aceita as duas tabelas usadas pelo pacote: 'pgn'/'name' e 'Moves'/'Name'/'Description'
+        index = cls()
+        if 'pgn' in dataframe.columns:
+            descriptions = [None] * len(dataframe)
+            for pgn, name, description in zip(dataframe['pgn'], dataframe['name'], descriptions):
+                index.add_line(pgn, name, description)
+        else:
+            for pgn, name, description in zip(dataframe['Moves'], dataframe['Name'], dataframe['Description']):
+                index.add_line(pgn, name, description)
+        return index
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            index = cls()
+            data = pickle.load(f)
+        if isinstance(data, dict):
+            # índices salvos antes de line_positions: só as posições finais são conhecidas
+            index.positions = data
+            index.line_positions = set(data)
+        else:
+            index.positions, index.line_positions = data
+        return index
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump((self.positions, self.line_positions), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def add_line(self, pgn, name, description=None):
+        import chess.pgn
+        game = chess.pgn.read_game(io.StringIO(pgn))
+        if game is None:
+            return
+
+        board = game.board()
+        for move in game.mainline_moves():
+            board.push(move)
+            self.line_positions.add(chess.polyglot.zobrist_hash(board))
+
+        # The first line reaching a position names it, as dataframe.loc[mask].iloc[0] did
+        self.positions.setdefault(chess.polyglot.zobrist_hash(board), (name, description))
+        self._fingerprint = None
+
+    def lookup(self, board):
+        """Returns (name, description) for the board's position, or None."""
+        return self.positions.get(chess.polyglot.zobrist_hash(board))
+
+    def on_line(self, board):
+        """Whether the board's position is reached along some line of the table."""
+        return chess.polyglot.zobrist_hash(board) in self.line_positions
+
+    def fingerprint(self):
+        # identifica o conteúdo do índice nas chaves do review_cache; calculado uma vez, add_line o refaz
+        if self._fingerprint is None:
+            self._fingerprint = review_key((sorted(self.positions.items()), sorted(self.line_positions)))
+        return self._fingerprint
+
+    def __len__(self):
+        return len(self.positions)
+
+
+compiled_openings = LRUCache(maxsize=8)
+
+
+def opening_index(openings):
+    """Returns the OpeningIndex for an openings DataFrame, compiling it once per DataFrame."""
+    if (openings is None) or isinstance(openings, OpeningIndex):
+        return openings
+
+    entry = compiled_openings.get(id(openings))
+    if (entry is None) or (entry[0] is not openings):
+        entry = (openings, OpeningIndex.from_dataframe(openings))
+        compiled_openings.put(id(openings), entry)
+    return entry[1]
+
+
+# Plies in which review_ply looks the played move up in the openings table
+OPENING_PLIES = 11
+
+
+def book_opening(position_after_move, openings_df=None):
+    """Name of the opening position_after_move is in, or None when it is out of the openings table."""
+    openings = opening_index(openings_df)
+    if openings is None:
+        return None
+    opening = openings.lookup(position_after_move)
+    return None if opening is None else opening[0]
+
+
+def is_book_ply(position_after_move, ply, openings_df=None):
+    """Whether review_ply classifies the move that led to position_after_move as book.
+
+    Such a ply is reviewed without any search.
+    """
+    return ply < OPENING_PLIES and book_opening(position_after_move, openings_df) is not None
+
+
+def book_plies(uci_moves, openings_df=None):
+    """How many plies from the start of the game follow a line of the openings table.
+
+    Every position along a line counts, not only the final positions review_ply names
+    (see is_book_ply). Those plies are not searched for the CPL: they count as 0 CPL
+    and the CPL searches start at the first position out of the table.
+    """
+    openings = opening_index(openings_df)
+    if openings is None:
+        return 0
+
+    board = chess.Board()
+    for ply, move in enumerate(uci_moves[:OPENING_PLIES]):
+        board.push(move)
+        if not openings.on_line(board):
+            return ply
+    return min(len(uci_moves), OPENING_PLIES)
+
+
+def opening_score(scores, uci_moves, openings_df=None):
+    """Score before the first ply of a game, the baseline of its accuracy.
+
+    0 for the initial position, or the score of the position where the book ends for a game
+    that opens in the book: its book plies all carry that score (see book_plies), so the change
+    of evaluation along the book line is not charged to the first book move.
+    """
+    if scores and book_plies(uci_moves, openings_df):
+        return scores[0]
+    return 0
+
+
+def book_position(uci_moves, book):
+    """The board after the first `book` plies of uci_moves."""
+    board = chess.Board()
+    for move in uci_moves[:book]:
+        board.push(move)
+    return board
+
+
+def board_from_pgn(pgn):
+    import chess.pgn
+    game = chess.pgn.read_game(io.StringIO(pgn))
+    board = chess.Board()
+    if game is not None:
+        for move in game.mainline_moves():
+            board.push(move)
+    return board
+
 
 def search_opening(dataframe, pgn):
 
-    # Check if the search_string is in column 'A'
-    mask = dataframe['pgn'] == pgn
+    opening = opening_index(dataframe).lookup(board_from_pgn(pgn))
 
-    # If there is a match, return the corresponding value in column 'B'
-    if any(mask):
-        return dataframe.loc[mask, 'name'].iloc[0]
+    if opening is not None:
+        return opening[0]
     else:
         return None
 
@@ -64,32 +566,43 @@ def is_defended(board: chess.Board, square, by_color=None, return_list_of_defend
     
     return False
 
-def check_for_hanging_pieces(board, return_list_of_hanging=False, fr_format=False):
+def piece_attack_masks(board):
+    return {square: board.attacks_mask(square) for square in chess.scan_forward(board.occupied)}
 
-    hanging_pieces = []
-    hanging_pieces_and_attackers = dict()
+def hanging_mask(board, attack_masks=None):
+    """Bitboard of the pieces attacked by the opponent and not defended by their own side."""
+    if attack_masks is None:
+        attack_masks = piece_attack_masks(board)
 
-    for square in chess.SQUARES:
-        maybe_hanging_piece = board.piece_at(square)
-        
-        if (maybe_hanging_piece is not None):
-            if not (is_defended(board, square)):
-                attackers = list(board.attackers(not maybe_hanging_piece.color, square))
-                if len(attackers) > 0:
-
-                    if fr_format:
-                        hanging_pieces_and_attackers[chess.square_name(square)] = [chess.square_name(s) for s in attackers]
-                        hanging_pieces.append(chess.square_name(square))
-                    else:
-                        hanging_pieces_and_attackers[square] = attackers
-                        hanging_pieces.append(square)
-                        #print(f'The {maybe_hanging_piece} is left hanging and can be captured by {', '.join(str(board.piece_at(p)) for p in attackers)}')
+    white = board.occupied_co[chess.WHITE]
+    attacked_by_white = 0
+    attacked_by_black = 0
+    for square, mask in attack_masks.items():
+        if white & chess.BB_SQUARES[square]:
+            attacked_by_white |= mask
+        else:
+            attacked_by_black |= mask
 
+    return (white & ~attacked_by_white & attacked_by_black) | (board.occupied_co[chess.BLACK] & ~attacked_by_black & attacked_by_white)
+
+def check_for_hanging_pieces(board, return_list_of_hanging=False, fr_format=False):
+
+    hanging_squares = list(chess.scan_forward(hanging_mask(board)))
 
     if return_list_of_hanging:
-        return hanging_pieces
-    else:
-        return hanging_pieces_and_attackers
+        if fr_format:
+            return [chess.square_name(square) for square in hanging_squares]
+        return hanging_squares
+
+    hanging_pieces_and_attackers = dict()
+    for square in hanging_squares:
+        attackers = list(board.attackers(not board.color_at(square), square))
+        if fr_format:
+            hanging_pieces_and_attackers[chess.square_name(square)] = [chess.square_name(s) for s in attackers]
+        else:
+            hanging_pieces_and_attackers[square] = attackers
+
+    return hanging_pieces_and_attackers
 
 def is_hanging(board: chess.Board, square, capturable_by=None, return_list_of_attackers=False):
     maybe_hanging_piece = board.piece_at(square)
@@ -124,24 +637,194 @@ def is_hanging(board: chess.Board, square, capturable_by=None, return_list_of_at
         
     return False
         
-def move_hangs_piece(board: chess.Board, move, return_hanging_squares=False):
-    #move = board.parse_san(move)
+def squares_changed_by_move(board: chess.Board, move):
+    # board is the position before the move
+    changed = chess.BB_SQUARES[move.from_square] | chess.BB_SQUARES[move.to_square]
+    if board.is_en_passant(move):
+        changed |= chess.BB_SQUARES[move.to_square - 8 if board.turn else move.to_square + 8]
+    elif board.is_castling(move):
+        changed |= chess.BB_RANK_MASKS[move.from_square]
+    return changed
+
+def attack_masks_after_move(board: chess.Board, attack_masks, changed):
+    """Updates piece_attack_masks of the previous position for `board`, the position after the move.
+
+    Only pieces standing on changed squares and sliders whose rays touch one are recomputed.
+    """
+    sliders = board.bishops | board.rooks | board.queens
+    updated = {}
+    for square, mask in attack_masks.items():
+        bb_square = chess.BB_SQUARES[square]
+        if bb_square & changed:
+            continue
+        if (mask & changed) and (bb_square & sliders):
+            updated[square] = board.attacks_mask(square)
+        else:
+            updated[square] = mask
 
+    for square in chess.scan_forward(changed & board.occupied):
+        updated[square] = board.attacks_mask(square)
+
+    return updated
+
+# Custo declarado por cada detector de review_move (ver detector):
+#   'cheap'  - olha só o lance e as posições antes e depois dele
+#   'scan'   - percorre os lances legais ou as casas de fuga de várias peças
+#   'engine' - pede buscas extras ao motor
+DETECTOR_PROFILES = {
+    'fast': ('cheap',),
+    'full': ('cheap', 'scan', 'engine'),
+}
+DETECTORS = {}  # nome do detector -> custo
+
+
+class FeatureContext:
+    """Facts about one position shared by the review_move detectors, each computed on first use.
+
+    The position after a move, the legal moves, the attack masks, the attackers of a square
+    and the hanging pieces are computed once per position, and so is every detector called
+    with features=context. Detectors whose cost is not in the profile (a DETECTOR_PROFILES
+    name or a tuple of costs) are skipped and return (), empty and falsy like a detector
+    that found nothing. The board must not be changed while its context is in use.
+    """
+
+    def __init__(self, board, profile='full', parent=None, move=None):
+        if isinstance(profile, str):
+            if profile not in DETECTOR_PROFILES:
+                raise ValueError(f"Perfil de detectores desconhecido: {profile!r}. Use um de {list(DETECTOR_PROFILES)}.")
+            profile = DETECTOR_PROFILES[profile]
+        self.board = board
+        self.costs = tuple(profile)
+        # referência fraca: sem ciclos, o contexto de um lance é liberado assim que a review termina
+        self.parent = weakref.ref(parent) if parent is not None else None
+        self.move = move
+        self._after = {}
+        self._memo = {}
+
+    def memo(self, key, compute):
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def runs(self, cost):
+        return cost in self.costs
+
+    def after(self, move):
+        """Context of the position after move (the board is copied once, history included)."""
+        context = self._after.get(move)
+        if context is None:
+            board = self.board.copy()
+            board.push(move)
+            context = self._after[move] = FeatureContext(board, self.costs, self, move)
+        return context
+
+    @property
+    def legal_moves(self):
+        return self.memo('legal_moves', lambda: list(self.board.legal_moves))
+
+    @property
+    def attack_masks(self):
+        return self.memo('attack_masks', self._attack_masks)
+
+    def _attack_masks(self):
+        # Depois de um lance, só as peças afetadas por ele são recalculadas
+        parent = self.parent() if self.parent is not None else None
+        if parent is not None and 'attack_masks' in parent._memo:
+            changed = squares_changed_by_move(parent.board, self.move)
+            return attack_masks_after_move(self.board, parent.attack_masks, changed)
+        return piece_attack_masks(self.board)
+
+    def attacked_by(self, color):
+        """Bitboard of the squares attacked by color."""
+        def compute():
+            pieces = self.board.occupied_co[color]
+            mask = 0
+            for square, attacks in self.attack_masks.items():
+                if pieces & chess.BB_SQUARES[square]:
+                    mask |= attacks
+            return mask
+        return self.memo(('attacked_by', color), compute)
+
+    def attackers(self, color, square):
+        """Squares of the pieces of color attacking square (defenders when color owns it)."""
+        return self.memo(('attackers', color, square), lambda: self.board.attackers(color, square))
+
+    @property
+    def hanging(self):
+        return self.memo('hanging', lambda: hanging_mask(self.board, self.attack_masks))
+
+
+def detector(cost):
+    """Declares a review_move detector and its cost ('cheap', 'scan' or 'engine').
+
+    Called with features=FeatureContext of its board, the detector runs at most once per
+    set of arguments (lists are returned as copies), or not at all when the context's
+    profile leaves its cost out. Without features it runs as a plain function.
+    Its time is reported to the active Instrumentation, if any.
+    """
+    def register(function):
+        DETECTORS[function.__name__] = cost
+
+        def call(board, args, features, kwargs):
+            if features is None or features.board is not board:
+                return function(board, *args, **kwargs)
+            if not features.runs(cost):
+                return ()
+            key = (function.__name__, args, tuple(sorted(kwargs.items())))
+            result = features.memo(key, lambda: function(board, *args, features=features, **kwargs))
+            return list(result) if isinstance(result, list) else result
+
+        @functools.wraps(function)
+        def wrapper(board, *args, features=None, **kwargs):
+            instruments = instrumentation.active_instrumentation()
+            if instruments is None:
+                return call(board, args, features, kwargs)
+            start = time.perf_counter()
+            try:
+                return call(board, args, features, kwargs)
+            finally:
+                instruments.detector_call(function.__name__, time.perf_counter() - start)
+
+        wrapper.cost = cost
+        return wrapper
+    return register
+
+def position_after(board, move, features=None):
+    # posição depois do lance: a do contexto, se houver, ou uma cópia nova
+    if features is not None:
+        return features.after(move).board
     position_after_move = board.copy()
     position_after_move.push(move)
+    return position_after_move
+
+@detector('cheap')
+def move_hangs_piece(board: chess.Board, move, return_hanging_squares=False, features=None):
+    #move = board.parse_san(move)
+
+    if features is not None:
+        hanging_before = features.hanging
+        hanging_after = features.after(move).hanging
+    else:
+        attack_masks = piece_attack_masks(board)
+        changed = squares_changed_by_move(board, move)
+        hanging_before = hanging_mask(board, attack_masks)
 
-    hanging_before = check_for_hanging_pieces(board, return_list_of_hanging=True)
-    hanging_after = check_for_hanging_pieces(position_after_move, return_list_of_hanging=True)
+        board.push(move)
+        try:
+            hanging_after = hanging_mask(board, attack_masks_after_move(board, attack_masks, changed))
+        finally:
+            board.pop()
 
     if return_hanging_squares:
-        return hanging_after
+        return list(chess.scan_forward(hanging_after))
     else:
         if hanging_before == hanging_after:
             return False
         else:
             return True
 
-def move_defends_hanging_piece(board: chess.Board, move, return_list_defended=False):
+@detector('cheap')
+def move_defends_hanging_piece(board: chess.Board, move, return_list_defended=False, features=None):
 
     if board.is_castling(move):
         if return_list_defended:
@@ -149,8 +832,7 @@ def move_defends_hanging_piece(board: chess.Board, move, return_list_defended=Fa
         return False
     #move = board.parse_san(move)
     
-    position_after_move = board.copy()
-    position_after_move.push(move)
+    position_after_move = position_after(board, move, features)
 
     defended_squares = []
     for defended_square in position_after_move.attacks(move.to_square):
@@ -168,23 +850,80 @@ def move_defends_hanging_piece(board: chess.Board, move, return_list_defended=Fa
         return False
 
 
-def move_creates_fork(board: chess.Board, move, return_forked_squares=False):        
+@detector('cheap')
+def move_creates_fork(board: chess.Board, move, return_forked_squares=False, features=None):        
 
-    position_after_move = board.copy()
-    position_after_move.push(move)
+    if features is not None:
+        return is_forking(features.after(move).board, move.to_square, return_forked_squares)
 
-    return is_forking(position_after_move, move.to_square, return_forked_squares)
+    board.push(move)
+    try:
+        return is_forking(board, move.to_square, return_forked_squares)
+    finally:
+        board.pop()
+
+# Forking moves per position, shared by move_allows_fork and move_misses_fork.
+fork_cache = LRUCache(maxsize=256)
+
+def attacks_from(piece_type, square, occupied):
+    # attack set of a piece of piece_type standing on square, straight from python-chess's tables
+    if piece_type == chess.KNIGHT:
+        return chess.BB_KNIGHT_ATTACKS[square]
+    elif piece_type == chess.KING:
+        return chess.BB_KING_ATTACKS[square]
+
+    attacks = 0
+    if piece_type in (chess.BISHOP, chess.QUEEN):
+        attacks |= chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+    if piece_type in (chess.ROOK, chess.QUEEN):
+        attacks |= (chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] |
+                    chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied])
+    return attacks
+
+def find_forking_moves(board: chess.Board, legal_moves=None):
+    """Legal moves of the side to move that create a fork (see is_forking), in legal_moves order.
+
+    A move is only played out (with push/pop) when the moved piece would attack at least two
+    enemy pieces from its destination; the result is cached per position.
+    legal_moves, when already known, saves generating them again.
+    """
+    key = chess.polyglot.zobrist_hash(board)
+    forking_moves = fork_cache.get(key)
+    if forking_moves is not None:
+        return list(forking_moves)
 
-def move_allows_fork(board: chess.Board, move, return_forking_moves=False):
-    
     forking_moves = []
+    enemies = board.occupied_co[not board.turn]
 
-    position_after_move = board.copy()
-    position_after_move.push(move)
+    for move in (list(board.legal_moves) if legal_moves is None else legal_moves):
+        piece_type = move.promotion or board.piece_type_at(move.from_square)
+        if piece_type == chess.PAWN:
+            continue
+
+        to_bb = chess.BB_SQUARES[move.to_square]
+        occupied = (board.occupied & ~chess.BB_SQUARES[move.from_square]) | to_bb
+        targets = attacks_from(piece_type, move.to_square, occupied) & enemies & ~to_bb
+        if chess.popcount(targets) < 2:
+            continue
+
+        if move_creates_fork(board, move):
+            forking_moves.append(move)
+
+    fork_cache.put(key, forking_moves)
+    return list(forking_moves)
 
-    for maybe_forking_move in position_after_move.legal_moves:
-        if move_creates_fork(position_after_move, maybe_forking_move):
-            forking_moves.append(maybe_forking_move)
+@detector('scan')
+def move_allows_fork(board: chess.Board, move, return_forking_moves=False, features=None):
+    
+    if features is not None:
+        after = features.after(move)
+        forking_moves = find_forking_moves(after.board, after.legal_moves)
+    else:
+        board.push(move)
+        try:
+            forking_moves = find_forking_moves(board)
+        finally:
+            board.pop()
 
     if return_forking_moves:
         return forking_moves
@@ -194,12 +933,9 @@ def move_allows_fork(board: chess.Board, move, return_forking_moves=False):
     else:
         return True
 
-def move_misses_fork(board: chess.Board, move, return_forking_moves=False):
-    forking_moves = []
-
-    for maybe_fork_move in board.legal_moves:
-        if move_creates_fork(board, maybe_fork_move):
-            forking_moves.append(maybe_fork_move)
+@detector('scan')
+def move_misses_fork(board: chess.Board, move, return_forking_moves=False, features=None):
+    forking_moves = find_forking_moves(board, features.legal_moves if features is not None else None)
 
     if return_forking_moves:
         return forking_moves
@@ -255,15 +991,15 @@ def is_forking(board: chess.Board, square, return_forked_squares=False):
         else:
             return False
         
-def move_blocks_check(board: chess.Board, move):
+@detector('cheap')
+def move_blocks_check(board: chess.Board, move, features=None):
 
     #move = board.parse_san(move)
 
     if (board.is_check()) and (not board.is_capture(move)):
 
         king_square = board.king(board.turn)   
-        position_after_move = board.copy()
-        position_after_move.push(move)
+        position_after_move = position_after(board, move, features)
 
         if str(position_after_move.piece_at(king_square)).lower() == 'k':
             return True
@@ -273,8 +1009,16 @@ def move_blocks_check(board: chess.Board, move):
     else:
         return False
 
-def evaluate(board, engine, return_mate_n=False): 
-    info = engine.analyse(board, chess.engine.Limit(**STOCKFISH_CONFIG)) 
+def evaluate(board, engine, return_mate_n=False, multipv=None): 
+    if multipv:
+        info = analyse_position(board, engine, multipv=multipv)[0]
+    else:
+        info = analyse_position(board, engine) 
+
+    return score_from_info(info, board.turn, return_mate_n)
+
+def score_from_info(info, turn, return_mate_n=False):
+    # turn is the side to move in the searched position
 
     possible_mate_score = str(info['score'].relative)
     if '#' in possible_mate_score:
@@ -282,7 +1026,7 @@ def evaluate(board, engine, return_mate_n=False):
         n = abs(int(possible_mate_score.replace("#", '')))
 
         if '+' in possible_mate_score:
-            if board.turn == True: # if black played the mate move
+            if turn == True: # if black played the mate move
                 if return_mate_n:
                     return 10000, n
                 else:
@@ -293,7 +1037,7 @@ def evaluate(board, engine, return_mate_n=False):
                 else:
                     return -10000
         else:
-            if board.turn == True: # if black played the mate move
+            if turn == True: # if black played the mate move
                 if return_mate_n:
                     return -10000, n
                 else:
@@ -305,9 +1049,9 @@ def evaluate(board, engine, return_mate_n=False):
                     return 10000
 
     # handle error if score is none when mate in n
-    if board.turn == True:
+    if turn == True:
         score = info['score'].relative.score()
-    elif board.turn == False:
+    elif turn == False:
         score = -info['score'].relative.score() # transform score to absolute score (pos in favor of white, neg in favor black)
 
     if return_mate_n:
@@ -318,7 +1062,7 @@ def evaluate(board, engine, return_mate_n=False):
 
 def evaluate_relative(board, engine): # <<< Modificação: Recebe 'engine'
     
-    info = engine.analyse(board, chess.engine.Limit(**STOCKFISH_CONFIG))
+    info = analyse_position(board, engine)
 
     possible_mate_score = str(info['score'].relative)
     if '#' in possible_mate_score:
@@ -331,16 +1075,16 @@ def evaluate_relative(board, engine): # <<< Modificação: Recebe 'engine'
     score = info['score'].relative.score()
     return score
 # OBSERVAÇÃO: Esta função precisa estar no mesmo arquivo ou ser importada.
-# Assumimos que STOCKFISH_CONFIG está configurado globalmente para a velocidade (ex: {"time": 0.3}).
+# O limite da busca vem da AnalysisConfig ativa (ou de STOCKFISH_CONFIG, ex: {"time": 0.3}).
 
 def get_best_move_persistent(board, engine):
     """Calcula o melhor lance usando a engine Stockfish persistente."""
     # A engine está aberta. Apenas analisamos.
-    info = engine.analyse(board, chess.engine.Limit(**STOCKFISH_CONFIG))
+    info = analyse_position(board, engine)
     # Retorna o primeiro lance da linha principal de variação (PV)
     return info["pv"][0]
 def has_mate_in_n(board, engine):
-        info = engine.analyse(board, chess.engine.Limit(**STOCKFISH_CONFIG))
+        info = analyse_position(board, engine)
 
         if '#' in str(info['score'].relative):
             return True
@@ -353,7 +1097,7 @@ def move_allows_mate(board: chess.Board, move, return_winning_player=False, engi
     position_after_move.push(move)
 
 
-    info = engine.analyse(position_after_move, chess.engine.Limit(**STOCKFISH_CONFIG))
+    info = analyse_position(position_after_move, engine)
 
     score = str(info['score'].relative)
 
@@ -371,19 +1115,52 @@ def move_allows_mate(board: chess.Board, move, return_winning_player=False, engi
     else:
         return True
 
-def calculate_points_gained_by_move(board: chess.Board, move, engine=None, **kwargs ):
-    previous_score = evaluate(board, engine=engine)
+def scores_from_multipv(board: chess.Board, move, engine, multipv):
+    """Reads the scores before and after `move` from one MultiPV search of `board`.
 
-    position_after_move = board.copy()
-    position_after_move.push(move)
+    Falls back to a search restricted to `move` when it is not among the top `multipv` lines.
+    """
+    lines = analyse_position(board, engine, multipv=multipv)
+    previous_score = score_from_info(lines[0], board.turn)
+
+    played_line = None
+    for line in lines:
+        if line.get('pv') and line['pv'][0] == move:
+            played_line = line
+            break
+
+    if played_line is None:
+        played_line = analyse_position(board, engine, root_moves=[move])
+
+    current_score = score_from_info(played_line, board.turn)
+
+    # the line is scored before the move is made, so a mate for the mover is one move closer afterwards
+    n = played_line['score'].relative.mate()
+    if n is not None:
+        n = n - 1 if n > 0 else -n
+
+    return previous_score, current_score, n
+
+def calculate_points_gained_by_move(board: chess.Board, move, engine=None, multipv=None, **kwargs ):
+    if multipv:
+        previous_score, current_score, n = scores_from_multipv(board, move, engine, multipv)
+    else:
+        previous_score = evaluate(board, engine=engine)
+
+        position_after_move = board.copy()
+        position_after_move.push(move)
 
-    current_score, n = evaluate(position_after_move, return_mate_n=True, engine=engine)
+        current_score, n = evaluate(position_after_move, return_mate_n=True, engine=engine)
     
     #points_gained = calculate_points_gained(position_after_move, previous_score)
 
     #print(previous_score, current_score)
 
-    if board.turn == True:
+    return points_gained_from_scores(board.turn, previous_score, current_score, n)
+
+def points_gained_from_scores(turn, previous_score, current_score, n):
+    # turn: side that made the move; the scores are from white's point of view
+    if turn == True:
 
         if (previous_score != 10000) and (current_score == 10000):
             return f'mates {n}'
@@ -415,10 +1192,48 @@ def calculate_points_gained_by_move(board: chess.Board, move, engine=None, **kwa
 
     return points_gained
 
-def classify_move(board: chess.Board, move, engine=None):
+# centipawn cutoffs between excellent, good, inaccuracy, mistake and blunder
+CLASSIFICATION_BOUNDARIES = (-20, -100, -250, -450)
+
+def depth_swing(info):
+    # how much the score moved between the last two depths of a search (see attach_depth_scores);
+    # None when unknown: searches made without escalation, entries of older eval_store files
+    return info.get('depth_swing') if info else None
+
+def needs_escalation(board: chess.Board, move, points_gained, engine, multipv, config):
+    if min(abs(points_gained - boundary) for boundary in CLASSIFICATION_BOUNDARIES) <= config.escalation_margin:
+        return True
+
+    # The searches behind points_gained are already cached
+    if multipv:
+        infos = [analyse_position(board, engine, multipv=multipv)[0]]
+    else:
+        board.push(move)
+        try:
+            infos = [analyse_position(board, engine)]
+        finally:
+            board.pop()
+        infos.append(analyse_position(board, engine))
+
+    # Sem histórico de profundidades só a margem das fronteiras decide
+    swings = [depth_swing(info) for info in infos]
+    return any(swing is not None and swing > config.instability_margin for swing in swings)
+
+def classify_move(board: chess.Board, move, engine=None, multipv=None):
+    # multipv=k classifies from one MultiPV search of the position before the move
 
-    points_gained = calculate_points_gained_by_move(board, move, engine=engine)
+    points_gained = calculate_points_gained_by_move(board, move, engine=engine, multipv=multipv)
 
+    # Two-tier search: only plies close to a boundary or with an unstable score are searched again, deeper
+    config = active_config()
+    if (config.escalation is not None) and (type(points_gained) != str):
+        if needs_escalation(board, move, points_gained, engine, multipv, config):
+            with using_config(config.escalated()):
+                points_gained = calculate_points_gained_by_move(board, move, engine=engine, multipv=multipv)
+
+    return classification_from_points(points_gained)
+
+def classification_from_points(points_gained):
     if type(points_gained) == str:
         # quite redundant put im putting it for clarity
         if 'mates' in points_gained: 
@@ -441,32 +1256,62 @@ def classify_move(board: chess.Board, move, engine=None):
     else:
         return 'blunder'
 
-def rank_moves(board: chess.Board, return_dict=False):
-    # ascending order
-    
-    scores = []
-    moves = [] # best to worst
+def classify_best_move(board: chess.Board, engine=None):
+    # classify_move for the engine's best move, read from the search that found it: the first
+    # line scores the position both before and after its first move, so nothing else is searched
+    info = analyse_position(board, engine)
+    score = score_from_info(info, board.turn)
 
-    for move in board.legal_moves:
+    # as in scores_from_multipv, a mate for the mover is one move closer after the move
+    n = info['score'].relative.mate()
+    if n is not None:
+        n = n - 1 if n > 0 else -n
 
-        position_after_move = board.copy()
-        position_after_move.push(move)
+    return classification_from_points(points_gained_from_scores(board.turn, score, score, n))
 
-        score = evaluate(position_after_move, engine= None)
-        
-        moves.append(move)
-        scores.append(score)
+def rank_moves(board: chess.Board, return_dict=False, engine=None, limit=None):
+    """Legal moves of board from best to worst for the side to move, from one MultiPV search.
+
+    limit ranks only the best `limit` moves. With return_dict the moves map to their scores,
+    from white's point of view as in evaluate. If the engine leaves moves out of its lines,
+    they are ranked by one more search restricted to them.
+    """
+    if engine is None:
+        raise ValueError("O motor (engine) deve ser passado para rank_moves.")
+
+    legal_moves = list(board.legal_moves)
+    if limit is not None:
+        n_lines = min(limit, len(legal_moves))
+    else:
+        n_lines = len(legal_moves)
+
+    lines = []
+    if n_lines > 0:
+        lines = list(analyse_position(board, engine, multipv=n_lines))
+
+        ranked = {line['pv'][0] for line in lines if line.get('pv')}
+        missing = [move for move in legal_moves if move not in ranked]
+        if missing and len(ranked) < n_lines:
+            lines += analyse_position(board, engine, multipv=min(len(missing), n_lines - len(ranked)), root_moves=missing)
 
-    moves = [m for _, m in sorted(zip(scores, moves))]
-    scores = sorted(scores)
+    # mates first and by distance, as the engine orders its own lines
+    lines = [line for line in lines if line.get('pv')]
+    lines.sort(key=lambda line: line['score'].relative.score(mate_score=100000), reverse=True)
+
+    scores = {}
+    for line in lines:
+        move = line['pv'][0]
+        if move not in scores:
+            scores[move] = score_from_info(line, board.turn)
+    moves = list(scores)[:n_lines]
 
     if return_dict:
-        return {m: s for m, s in zip(moves, scores)}
+        return {m: scores[m] for m in moves}
     else:
         return moves
 
-
-def is_developing_move(board: chess.Board, move):
+@detector('cheap')
+def is_developing_move(board: chess.Board, move, features=None):
     #move = board.parse_san(move)
 
     if move.from_square in [chess.B1, chess.G1, chess.B8, chess.G8]:
@@ -492,7 +1337,8 @@ def is_developing_move(board: chess.Board, move):
     else:
         return False
 
-def is_fianchetto(board: chess.Board, move):
+@detector('cheap')
+def is_fianchetto(board: chess.Board, move, features=None):
     #move = board.parse_san(move)
 
     if str(board.piece_at(move.from_square)).lower() == 'b':
@@ -511,7 +1357,7 @@ def check_for_threats(board: chess.Board, moves_ahead=2, take_turns=False, by_op
     opponent_color = not board.turn
     
     if take_turns:
-        info = engine.analyse(board, chess.engine.Limit(**STOCKFISH_CONFIG))
+        info = analyse_position(board, engine)
 
         threat_moves = info['pv'][:moves_ahead]
 
@@ -524,7 +1370,7 @@ def check_for_threats(board: chess.Board, moves_ahead=2, take_turns=False, by_op
                 experiment_board.turn = opponent_color
             else:
                 experiment_board.turn = not opponent_color
-                info = engine.analyse(experiment_board, chess.engine.Limit(**STOCKFISH_CONFIG))
+                info = analyse_position(experiment_board, engine)
             
             best_move = info['pv'][0]
             threat_moves.append(best_move)
@@ -536,7 +1382,8 @@ def check_for_threats(board: chess.Board, moves_ahead=2, take_turns=False, by_op
 
     return threat_moves
 
-def is_possible_trade(board: chess.Board, move):
+@detector('cheap')
+def is_possible_trade(board: chess.Board, move, features=None):
     #move = board.parse_san(move)
     
     if board.is_capture(move):
@@ -570,9 +1417,9 @@ def is_possible_trade(board: chess.Board, move):
         
         return False
 
-def move_is_discovered_check(board: chess.Board, move):
-    position_after_move = board.copy()
-    position_after_move.push(move)
+@detector('cheap')
+def move_is_discovered_check(board: chess.Board, move, features=None):
+    position_after_move = position_after(board, move, features)
 
     if position_after_move.is_check():
         for attacked_square in position_after_move.attacks(move.to_square):
@@ -582,14 +1429,14 @@ def move_is_discovered_check(board: chess.Board, move):
         
     return False
 
-def move_is_discovered_check_and_attacks(board: chess.Board, move, return_attacked_squares=False):
-    if not move_is_discovered_check(board, move):
+@detector('cheap')
+def move_is_discovered_check_and_attacks(board: chess.Board, move, return_attacked_squares=False, features=None):
+    if not move_is_discovered_check(board, move, features=features):
         if return_attacked_squares:
             return []
         return False
     
-    position_after_move = board.copy()
-    position_after_move.push(move)
+    position_after_move = position_after(board, move, features)
 
     attacked_squares = []
 
@@ -692,9 +1539,9 @@ def is_trapped(board: chess.Board, square, by):
     else:
         return False
 
-def move_traps_opponents_piece(board: chess.Board, move, return_trapped_squares=False):
-    position_after_move = board.copy()
-    position_after_move.push(move)
+@detector('scan')
+def move_traps_opponents_piece(board: chess.Board, move, return_trapped_squares=False, features=None):
+    position_after_move = position_after(board, move, features)
 
     trapped_squares = []
 
@@ -712,7 +1559,8 @@ def move_traps_opponents_piece(board: chess.Board, move, return_trapped_squares=
     else:
         return False
 
-def is_possible_sacrifice(board: chess.Board, move):
+@detector('cheap')
+def is_possible_sacrifice(board: chess.Board, move, features=None):
 
     if str(board.piece_at(move.from_square)).lower() == 'p':
         return False
@@ -751,17 +1599,10 @@ def is_possible_sacrifice(board: chess.Board, move):
         
         return False
 
-def move_pins_opponent(board: chess.Board, move, return_pinned_square=False):
+@detector('cheap')
+def move_pins_opponent(board: chess.Board, move, return_pinned_square=False, features=None):
     #move = board.parse_san(move)
 
-    if board.is_attacked_by(not board.turn, move.to_square):
-        if (not is_defended(board, move.to_square, by_color=board.turn)):
-            return False
-
-    position_after_move = board.copy()
-    position_after_move.push(move)
-    pinned_square = None
-
     '''
     for square in chess.SQUARES: # check if there already is a pin
         piece = board.piece_at(square)
@@ -771,6 +1612,34 @@ def move_pins_opponent(board: chess.Board, move, return_pinned_square=False):
                     return False
     '''
 
+    if features is not None:
+        to_bb = chess.BB_SQUARES[move.to_square]
+        if (features.attacked_by(not board.turn) & to_bb) and not (features.attacked_by(board.turn) & to_bb):
+            return False
+        pinned_square = pinned_square_after_move(features.after(move).board, move)
+    else:
+        if board.is_attacked_by(not board.turn, move.to_square):
+            if (not is_defended(board, move.to_square, by_color=board.turn)):
+                return False
+
+        board.push(move)
+        try:
+            pinned_square = pinned_square_after_move(board, move)
+        finally:
+            board.pop()
+
+    if return_pinned_square:
+        return pinned_square        
+
+    if pinned_square is not None:
+        return True
+    else:
+        return False
+
+def pinned_square_after_move(position_after_move: chess.Board, move):
+    # peça do oponente atacada pela peça movida e cravada no próprio rei
+    pinned_square = None
+
     possible_pinned_squares = list(position_after_move.attacks(move.to_square))
     for square in possible_pinned_squares:
         if (position_after_move.piece_at(square) is not None) and (position_after_move.piece_at(square).color == position_after_move.turn):
@@ -781,19 +1650,15 @@ def move_pins_opponent(board: chess.Board, move, return_pinned_square=False):
             else:
                 pinned_square = None
 
-    if return_pinned_square:
-        return pinned_square        
-
-    if pinned_square is not None:
-        return True
-    else:
-        return False
+    return pinned_square
 
-def board_has_pin(board: chess.Board, return_pin_moves=False):
+@detector('scan')
+def board_has_pin(board: chess.Board, return_pin_moves=False, features=None):
 
     pin_moves = []
 
-    for move in board.legal_moves:
+    # cada lance é testado com push/pop (sem features): nenhuma cópia do tabuleiro por lance
+    for move in (features.legal_moves if features is not None else list(board.legal_moves)):
         if move_pins_opponent(board, move):
             pin_moves.append(move)
 
@@ -805,11 +1670,12 @@ def board_has_pin(board: chess.Board, return_pin_moves=False):
     else:
         return False
 
-def move_misses_pin(board: chess.Board, move, return_pin_move=False):
+@detector('scan')
+def move_misses_pin(board: chess.Board, move, return_pin_move=False, features=None):
     # doesn't exactly mean that player made a pin just because it's false
     #move = board.parse_san(move)
 
-    pin_moves = board_has_pin(board, return_pin_moves=True)
+    pin_moves = board_has_pin(board, return_pin_moves=True, features=features)
 
     if return_pin_move:
         return pin_moves
@@ -833,7 +1699,8 @@ def move_misses_mate(board: chess.Board, move):
         else:
             return True
 
-def moves_rook_to_open_file(board: chess.Board, move):
+@detector('cheap')
+def moves_rook_to_open_file(board: chess.Board, move, features=None):
     # use best move to see if you missed an opportunity to put rook in open file
     from_square_reqs = list(range(16)) + list(range(48, 64))
     
@@ -857,15 +1724,15 @@ def is_an_opening(game: str, return_name_and_desc=True, openings_df=None): #
     if openings_df is None: # Se o usuário não forneceu, retorna None.
         return None, None
         
-    opening = openings_df[openings_df['Moves'] == game] #
+    opening = opening_index(openings_df).lookup(board_from_pgn(game)) #
     
     if return_name_and_desc:
-        if opening.empty:
+        if opening is None:
                 return None, None
         else:
-            return (opening['Name'].iloc[0], opening['Description'].iloc[0])
+            return opening
     else:
-        if opening.empty:
+        if opening is None:
             return False
         else:
             return True
@@ -884,7 +1751,8 @@ def is_endgame(board: chess.Board):
     else:
         return False
 
-def move_moves_king_off_backrank(board: chess.Board, move):
+@detector('cheap')
+def move_moves_king_off_backrank(board: chess.Board, move, features=None):
     #move = board.parse_san(move)
 
     backrank_squares = list(range(0, 8)) + list(range(56, 64))
@@ -896,10 +1764,10 @@ def move_moves_king_off_backrank(board: chess.Board, move):
         
     return False
 
-def move_attacks_piece(board: chess.Board, move: chess.Move, return_attacked_piece=False):
+@detector('cheap')
+def move_attacks_piece(board: chess.Board, move: chess.Move, return_attacked_piece=False, features=None):
 
-    position_after_move = board.copy()
-    position_after_move.push(move)
+    position_after_move = position_after(board, move, features)
     
     if is_defended(position_after_move, move.to_square) or not board.is_attacked_by(position_after_move.turn, move.to_square):
         attacked_squares = list(position_after_move.attacks(move.to_square))
@@ -919,10 +1787,11 @@ def move_attacks_piece(board: chess.Board, move: chess.Move, return_attacked_pie
     
     return False
 
-def move_wins_tempo(board: chess.Board, move, engine=None):
+@detector('engine')
+def move_wins_tempo(board: chess.Board, move, engine=None, multipv=None, features=None):
     #move = board.parse_san(move)
 
-    if not move_attacks_piece(board, move):
+    if not move_attacks_piece(board, move, features=features):
         return False
 
     #position_after_move = board.copy()
@@ -930,7 +1799,7 @@ def move_wins_tempo(board: chess.Board, move, engine=None):
 
     #attacking_piece = position_after_move.piece_at(move.to_square)
 
-    points_gained = calculate_points_gained_by_move(board, move, engine=engine)
+    points_gained = calculate_points_gained_by_move(board, move, engine=engine, multipv=multipv)
 
     if type(points_gained) == str:
         return False
@@ -941,6 +1810,7 @@ def move_wins_tempo(board: chess.Board, move, engine=None):
     return False
 
 def parse_pgn(pgn, san_only=False):
+    import chess.pgn
     pgn = io.StringIO(pgn)
     pgn = chess.pgn.read_game(pgn)
 
@@ -959,13 +1829,25 @@ def parse_pgn(pgn, san_only=False):
         return san_moves, fens
 
     else:
-        for move in pgn.mainline_moves():
-            san_moves.append(board.san(move))
-            board.push(move)
-            uci_moves.append(move)
-            fens.append(board.fen())
-    
-        return uci_moves, san_moves, fens
+        return replay_moves(pgn.mainline_moves())
+
+def replay_moves(moves):
+    """uci_moves, san_moves and fens of a game given as a sequence of moves (chess.Move or UCI strings)."""
+    board = chess.Board()
+
+    san_moves = []
+    uci_moves = []
+    fens = []
+
+    for move in moves:
+        if isinstance(move, str):
+            move = chess.Move.from_uci(move)
+        san_moves.append(board.san(move))
+        board.push(move)
+        uci_moves.append(move)
+        fens.append(board.fen())
+
+    return uci_moves, san_moves, fens
 
 def convert_movelist_to_pgn(moves: list):
     pgn = ""
@@ -981,18 +1863,20 @@ def convert_movelist_to_pgn(moves: list):
 
     return pgn.strip()
 
-def move_captures_free_piece(board: chess.Board, move):
+@detector('cheap')
+def move_captures_free_piece(board: chess.Board, move, features=None):
     if board.is_capture(move):
         if is_hanging(board, move.to_square, capturable_by=board.turn):
             return True
         
     return False
 
-def move_misses_free_piece(board: chess.Board, move, return_free_captures=False):
+@detector('scan')
+def move_misses_free_piece(board: chess.Board, move, return_free_captures=False, features=None):
 
     free_captures = []
 
-    for legal_move in board.legal_moves:
+    for legal_move in (features.legal_moves if features is not None else board.legal_moves):
         if move_captures_free_piece(board, legal_move):
             free_captures.append(legal_move)
 
@@ -1007,18 +1891,20 @@ def move_misses_free_piece(board: chess.Board, move, return_free_captures=False)
         else:
             return True
 
-def move_threatens_mate(board: chess.Board, move, engine):
+@detector('engine')
+def move_threatens_mate(board: chess.Board, move, engine, features=None):
 
-    experiment_board = board.copy()
-    experiment_board.push(move)
+    experiment_board = position_after(board, move, features)
 
     if experiment_board.is_check():
         return False
 
+    # o tabuleiro do contexto é compartilhado: o lance nulo é desfeito em seguida
     experiment_board.push(chess.Move.null())
-
-
-    info = engine.analyse(experiment_board, chess.engine.Limit(**STOCKFISH_CONFIG))
+    try:
+        info = analyse_position(experiment_board, engine)
+    finally:
+        experiment_board.pop()
 
     score = str(info['score'].relative)
 
@@ -1037,7 +1923,8 @@ def is_capturable_by_lower_piece(board: chess.Board, square, capturable_by):
 
 # Arquivo: chess_review.py
 
-def move_captures_higher_piece(board: chess.Board, move):
+@detector('cheap')
+def move_captures_higher_piece(board: chess.Board, move, features=None):
     
     # 1. Deve ser uma captura
     if not board.is_capture(move):
@@ -1054,7 +1941,8 @@ def move_captures_higher_piece(board: chess.Board, move):
     
     return False
 
-def check_for_capturable_pieces_by_lower(board: chess.Board):
+@detector('cheap')
+def check_for_capturable_pieces_by_lower(board: chess.Board, features=None):
 
     capturable_squares = []
 
@@ -1067,14 +1955,14 @@ def check_for_capturable_pieces_by_lower(board: chess.Board):
 
 def get_best_move(board: chess.Board, engine):
 
-    info = engine.analyse(board, chess.engine.Limit(**STOCKFISH_CONFIG))
+    info = analyse_position(board, engine)
 
     best_move = info['pv'][0]
     return best_move
 
 def get_best_sequence(board: chess.Board, engine):
 
-    info = engine.analyse(board, chess.engine.Limit(**STOCKFISH_CONFIG))
+    info = analyse_position(board, engine)
 
     best_move = info['pv']
     return best_move
@@ -1099,7 +1987,7 @@ def get_lost_pieces(board: chess.Board):
 
 def mate_in_n_for(board, engine):
 
-    info = engine.analyse(board, chess.engine.Limit(**STOCKFISH_CONFIG))
+    info = analyse_position(board, engine)
     score = str(info['score'].relative)
 
     print(score)
@@ -1115,31 +2003,35 @@ def mate_in_n_for(board, engine):
         losing_side = 'Black' if (board.turn == True) else 'White'
         return f'{losing_side} gets checkmated in {n}. '
 
-def compute_cpl(moves: list, engine):
+def evaluate_for_cpl(board, engine, multipv=None):
+    score = evaluate(board, engine, multipv=multipv)
+    if score == 10000:
+        score = 1000
+    elif score == -10000:
+        score = -1000
+    return score
+
+def compute_cpl(moves: list, engine, openings_df=None):
     cpls_white = []
     cpls_black = []
     scores = []
 
     board = chess.Board()
 
-    for e, move in (enumerate(tqdm(moves))):
+    # Each position is searched once: its score is the best-play value of the move
+    # about to be made and the played value of the move that led to it.
+    # Book plies are not searched: all of them get the score of the position where
+    # the book ends, the first one searched, so they lose no centipawns.
+    book = book_plies(moves, openings_df)
+    score_best = evaluate_for_cpl(book_position(moves, book), engine)
 
-        comp_board = board.copy()
-        best_move = get_best_move(comp_board, engine)
-        comp_board.push(best_move)
-        score_best = evaluate(comp_board, engine)
-        if score_best == 10000:
-            score_best = 1000
-        elif score_best == -10000:
-            score_best = -1000
+    for e, move in enumerate(instrumentation.track(moves)):
 
         board.push(move)
-        score_player = evaluate(board, engine)
-        if score_player == 10000:
-            score_player = 1000
-        elif score_player == -10000:
-            score_player = -1000
-
+        if e < book:
+            score_player = score_best
+        else:
+            score_player = evaluate_for_cpl(board, engine)
 
         scores.append(score_player)
 
@@ -1148,52 +2040,24 @@ def compute_cpl(moves: list, engine):
         else:
             cpls_black.append(abs(score_best - score_player))
 
+        score_best = score_player
+
     average_cpl_white = sum(cpls_white)/len(cpls_white)
     average_cpl_black = sum(cpls_black)/len(cpls_black)
 
     return scores, cpls_white, cpls_black, average_cpl_white, average_cpl_black
 
 def estimate_elo(acpl, n_moves):
-    if acpl > 500:
-        return 100
-    
-    e = 2.71828
-    estimate = 3000 * (e ** (-0.01*acpl)) * ((n_moves/50)**0.5)
-    return math.ceil(estimate / 100) * 100
-
-def calculate_accuracy(eval_scores):
-
-    eval_scores = [0] + eval_scores
-    def calculate_win_percentage(cp_eval, color):
-        if color == 'w':
-            return 50 + 50 * (2 / (1 + np.exp(-0.00368208 * cp_eval)) - 1)
-        elif color == 'b':
-            return 50 + 50 * (2 / (1 + np.exp(0.00368208 * cp_eval)) - 1)
-        
-    white_win_percentages = [calculate_win_percentage(s, 'w') for s in eval_scores]
-    black_win_percentages = [100-p for p in white_win_percentages]
+    from saulochess import analytics
+    return int(analytics.batch_elo(acpl, n_moves))
 
+def calculate_accuracy(eval_scores, initial_score=0):
     # Accuracy% = 103.1668 * exp(-0.04354 * (winPercentBefore - winPercentAfter)) - 3.1669
-    white_accuracies = []
-    black_accuracies = []
-    for i in range(len(white_win_percentages)-1):
-        #100.03072339664806 * exp(-0.10082980372791278 * x) + -0.030767264030683358
-        if i%2 == 0:
-            win_delta = white_win_percentages[i] - white_win_percentages[i+1]
-            if win_delta <= 0:
-                white_accuracies.append(100)
-            else:
-                accuracy = 100.0307234 * np.exp(-0.1008298 * (win_delta)) - 0.03076726
-                white_accuracies.append(accuracy)
-        else:
-            win_delta = black_win_percentages[i] - black_win_percentages[i+1]
-            if win_delta <= 0:
-                black_accuracies.append(100)
-            else:
-                accuracy = 100.0307234 * np.exp(-0.1008298 * (win_delta)) - 0.03076726
-                black_accuracies.append(accuracy)
-
-    return np.mean(white_accuracies), np.mean(black_accuracies)
+    # (curva ajustada: 100.03072339664806 * exp(-0.10082980372791278 * x) + -0.030767264030683358)
+    # initial_score: avaliação antes do primeiro lance (veja opening_score)
+    from saulochess import analytics
+    white_accuracy, black_accuracy = analytics.batch_accuracy(eval_scores, [0, len(eval_scores)], initial_score)
+    return white_accuracy[0], black_accuracy[0]
 
 def calculate_material(board: chess.Board):
     white_material = 0
@@ -1244,41 +2108,66 @@ def get_development(board: chess.Board):
 
     return white_dev, black_dev
 
-def get_tension(board):
-    player_tension = sum(1 for move in board.legal_moves if board.is_capture(move))
+def count_moves(board):
+    # mobility (moves of non-pawn pieces) and tension (captures) of the side to move,
+    # from a single pass over its legal moves
+    mobility = 0
+    tension = 0
+    pawns = board.pawns
+    for move in board.legal_moves:
+        if not pawns & chess.BB_SQUARES[move.from_square]:
+            mobility += 1
+        if board.is_capture(move):
+            tension += 1
+    return mobility, tension
+
+def count_moves_both_sides(board):
+    player = count_moves(board)
     board.push(chess.Move.null())  # Make a null move to switch turns
-    opponent_tension = sum(1 for move in board.legal_moves if board.is_capture(move))
+    opponent = count_moves(board)
     board.pop()  # Undo the null move
 
     if board.turn == True:
-        return player_tension, opponent_tension
+        return player, opponent  # white, black
     else:
-        return opponent_tension, player_tension
+        return opponent, player  # white, black
+
+def get_tension(board):
+    white, black = count_moves_both_sides(board)
+    return white[1], black[1]
 
 def get_mobility(board):
-    player_mobility = sum(1 for move in board.legal_moves if str(board.piece_at(move.from_square)).lower() != 'p')
-    board.push(chess.Move.null())  # Make a null move to switch turns
-    opponent_mobility = sum(1 for move in board.legal_moves if str(board.piece_at(move.from_square)).lower() != 'p')
-    board.pop()  # Undo the null move
+    white, black = count_moves_both_sides(board)
+    return white[0], black[0]
 
-    if board.turn == True:
-        return player_mobility, opponent_mobility  # white, black
-    else:
-        return opponent_mobility, player_mobility  # white, black
+def get_control(board: chess.Board, attack_masks=None):
+    if attack_masks is None:
+        attack_masks = piece_attack_masks(board)
 
-def get_control(board: chess.Board):
+    white = board.occupied_co[chess.WHITE]
     white_control = 0
     black_control = 0
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece is not None:
-            if piece.color == True:
-                white_control += len(board.attacks(square))
-            else:
-                black_control += len(board.attacks(square))
+    for square, mask in attack_masks.items():
+        if white & chess.BB_SQUARES[square]:
+            white_control += chess.popcount(mask)
+        else:
+            black_control += chess.popcount(mask)
 
     return white_control, black_control
 
+def position_metrics(board: chess.Board):
+    """Development, mobility, tension and control of the position, each as [white, black].
+
+    The legal moves of each side are generated once and shared by mobility and tension.
+    """
+    white, black = count_moves_both_sides(board)
+    return (
+        list(get_development(board)),
+        [white[0], black[0]],
+        [white[1], black[1]],
+        list(get_control(board)),
+    )
+
 def calculate_metrics(fens):
 
     devs = []
@@ -1287,11 +2176,11 @@ def calculate_metrics(fens):
     conts = []
 
     for fen in fens:
-        board = chess.Board(fen)
-        devs.append(list(get_development(board)))
-        mobs.append(list(get_mobility(board)))
-        tens.append(list(get_tension(board)))
-        conts.append(list(get_control(board)))
+        dev, mob, ten, cont = position_metrics(chess.Board(fen))
+        devs.append(dev)
+        mobs.append(mob)
+        tens.append(ten)
+        conts.append(cont)
 
     return devs, mobs, tens, conts
 
@@ -1312,7 +2201,12 @@ piece_dict_en = {
     'b': 'Bishop'
 }
 
-def review_move(board: chess.Board, move, previous_review: str, check_if_opening=False, engine=None, openings_df = None, language = 'en'): # <<< Adicionado 'engine=None'
+def review_move(board: chess.Board, move, previous_review: str, check_if_opening=False, engine=None, openings_df = None, language = 'en', multipv=None, detectors=None, features=None, classification=None): # <<< Adicionado 'engine=None'
+    # detectors: perfil dos detectores (ver DETECTOR_PROFILES); por padrão o da AnalysisConfig ativa
+    # features: FeatureContext de board já usado por outra review da mesma posição (ver review_best_move)
+    # classification: classificação já conhecida do lance, que dispensa o classify_move
+    if detectors is None:
+        detectors = active_config().detectors
     
     # 🚨 Se 'get_best_move' não for uma função persistente, precisamos de uma.
     # Vamos usar 'get_best_move_persistent(board, engine)' no corpo.
@@ -1331,22 +2225,32 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
             formatted_items = ", ".join(items[:-1]) + ", and " + items[-1]
             return formatted_items
 
-        position_after_move = board.copy()
-        position_after_move.push(move)
+        # Fatos das posições antes e depois do lance, compartilhados pelos detectores
+        if features is None:
+            features = FeatureContext(board, detectors)
+        features_after = features.after(move)
+        position_after_move = features_after.board
         
         review = ''
 
-        # CHAVE DE MUDANÇA 1: Usa a versão persistente
-        best_move = get_best_move_persistent(board, engine) # <<< MUDANÇA AQUI!
-
+        # Lance de teoria: nenhuma busca, o melhor lance é o da própria linha do livro
         if check_if_opening and (openings_df is not None):
-            opening = search_opening(openings_df, get_board_pgn(position_after_move))
+            opening = book_opening(position_after_move, openings_df)
             if opening is not None:
                 review = f'Esse é um movimeno de teoria. A abertura jogada é conhecida como {opening}. '
-                return 'book', review, best_move, board.san(best_move)
+                return 'book', review, move, board.san(move)
+
+        # CHAVE DE MUDANÇA 1: Usa a versão persistente
+        if multipv:
+            # Uma única busca MultiPV serve o melhor lance e a classificação
+            analyse_position(board, engine, multipv=multipv)
+        best_move = get_best_move_persistent(board, engine) # <<< MUDANÇA AQUI!
         
         # OBS: Você precisará garantir que 'classify_move' também use a 'engine' persistente internamente
-        move_classication = classify_move(board, move, engine) # <<< Você provavelmente precisará passar 'engine' para 'classify_move'
+        if classification is None:
+            move_classication = classify_move(board, move, engine, multipv=multipv) # <<< Você provavelmente precisará passar 'engine' para 'classify_move'
+        else:
+            move_classication = classification
 
         if move_classication in ['excellent', 'good']:
 
@@ -1356,14 +2260,14 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
             
             trade = False
 
-            if is_possible_trade(board, move) and not move_is_discovered_check(board, move):
+            if is_possible_trade(board, move, features=features) and not move_is_discovered_check(board, move, features=features):
                 if board.is_capture(move):
                     review += 'Isso é uma troca. '
                 else:
                     review += 'Isso oferece uma troca. '
                 trade = True
 
-            defended_pieces = move_defends_hanging_piece(board, move, return_list_defended=True)
+            defended_pieces = move_defends_hanging_piece(board, move, return_list_defended=True, features=features)
             defended_squares = [chess.square_name(s) for s in defended_pieces]
             defended_pieces = [piece_dict[str(board.piece_at(s)).lower()] for s in defended_pieces]
 
@@ -1376,61 +2280,61 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
                 
                 review += f'Isso defende {format_item_list(defended_pieces)} em {format_item_list(defended_squares)}. '
 
-            possible_forked_squares = move_creates_fork(board, move, return_forked_squares=True)
+            possible_forked_squares = move_creates_fork(board, move, return_forked_squares=True, features=features)
             if len(possible_forked_squares) >= 2:
                 forked_pieces = [piece_dict[str(board.piece_at(s)).lower()] for s in possible_forked_squares]
                 review += f'Isso cria um garfo em {format_item_list(forked_pieces)}. '
             else:
-                possible_attakced_piece = move_attacks_piece(board, move, return_attacked_piece=True)
+                possible_attakced_piece = move_attacks_piece(board, move, return_attacked_piece=True, features=features)
                 if possible_attakced_piece is not False:
                     review += f'Isso ataca um(a) {piece_dict[str(possible_attakced_piece).lower()]}. '
 
 
-            if move_blocks_check(board, move):
+            if move_blocks_check(board, move, features=features):
                 review += f'Isso bloqueia um xeque no rei com uma peça. '
 
-            developing = is_developing_move(board, move)
+            developing = is_developing_move(board, move, features=features)
             if developing is not False:
                 review += f'Isso desenvolve um(a) {piece_dict[developing.lower()]}. '
             
-            if is_fianchetto(board, move):
+            if is_fianchetto(board, move, features=features):
                 review += 'Isso fianqueta o bispo ao colocá-lo numa diagonal poderosa. '
 
-            if move_pins_opponent(board, move):
+            if move_pins_opponent(board, move, features=features):
                 review += 'Isso prende uma peça do oponente ao seu rei. '
 
-            if moves_rook_to_open_file(board, move):
+            if moves_rook_to_open_file(board, move, features=features):
                 review += "Ao colocar a torre em uma coluna aberta, ela controla colunas importantes. "
 
             if is_endgame(board):
-                if move_moves_king_off_backrank(board, move):
+                if move_moves_king_off_backrank(board, move, features=features):
                     review += "Ao mover o rei para fora da última fileira, o risco de ameaças de mate na última fileira é reduzido e melhora a segurança do rei. "
 
-            if move_wins_tempo(board, move, engine=engine):
+            if move_wins_tempo(board, move, engine=engine, multipv=multipv, features=features):
                 review += 'Esse movimento ganha ritmo. '
 
             if 'trade' not in previous_review:
 
-                if move_captures_higher_piece(board, move):
+                if move_captures_higher_piece(board, move, features=features):
                     review += f'Isso captura uma peça de maior valor que a sua. '
 
                 if 'higher value piece' not in previous_review:
-                    if move_captures_free_piece(board, move):
+                    if move_captures_free_piece(board, move, features=features):
                         review += f'Isso captura de graça um(a) {piece_dict[str(board.piece_at(move.to_square)).lower()]}. '
 
-            attacked_squares_with_check = move_is_discovered_check_and_attacks(board, move, return_attacked_squares=True)
+            attacked_squares_with_check = move_is_discovered_check_and_attacks(board, move, return_attacked_squares=True, features=features)
             if len(attacked_squares_with_check) > 0:
                 attacked_pieces_with_check = [board.piece_at(s) for s in attacked_squares_with_check]
                 attacked_pieces_with_check = [piece_dict[str(p).lower()] for p in attacked_pieces_with_check]
                 review += f'Isso cria um xeque descoberto ao atacar um(a) {format_item_list(attacked_pieces_with_check)}. '
 
-            trapped_squares = move_traps_opponents_piece(board, move, return_trapped_squares=True)
+            trapped_squares = move_traps_opponents_piece(board, move, return_trapped_squares=True, features=features)
             if len(trapped_squares) > 0:
                 trapped_pieces = [board.piece_at(s) for s in trapped_squares]
                 trapped_pieces = [piece_dict[str(p).lower()] for p in trapped_pieces]
                 review += f'Isso prende um(a) {format_item_list(trapped_pieces)}. '
 
-            if is_possible_sacrifice(board, move):
+            if is_possible_sacrifice(board, move, features=features):
                 #if move_classication != 'good':
                 move_classication = 'brilliant'
                 review = review.replace('best', 'brilliant')
@@ -1438,7 +2342,7 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
                 review = review.replace('excellent', 'brilliant')
                 review += f'Isso sacrifica o(a) {piece_dict[str(board.piece_at(move.from_square)).lower()]}. '
 
-            if move_threatens_mate(board, move, engine=engine):
+            if move_threatens_mate(board, move, engine=engine, features=features):
                 review += 'Isso cria uma ameaça de xeque-mate. '
 
 
@@ -1447,9 +2351,9 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
 
             possible_hanging_squares = []
             if ('creates a fork' not in previous_review) or (not board.is_check()) or ('trade' not in previous_review) or ('lower value' not in previous_review):
-                possible_hanging_squares = move_hangs_piece(board, move, return_hanging_squares=True)
+                possible_hanging_squares = move_hangs_piece(board, move, return_hanging_squares=True, features=features)
 
-                if is_possible_trade(board, move):
+                if is_possible_trade(board, move, features=features):
                     if move.to_square in possible_hanging_squares:
                         del possible_hanging_squares[possible_hanging_squares.index(move.to_square)]
 
@@ -1459,27 +2363,27 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
                     hanging_pieces = [piece_dict[str(position_after_move.piece_at(s)).lower()] for s in possible_hanging_squares]
                     review += f'Esse movimento deixa {format_item_list(hanging_pieces)} pendurado em {format_item_list(hanging_squares)}. '
 
-            capturable_pieces_by_lower = check_for_capturable_pieces_by_lower(position_after_move)
+            capturable_pieces_by_lower = check_for_capturable_pieces_by_lower(position_after_move, features=features_after)
             capturable_pieces_by_lower = [s for s in capturable_pieces_by_lower if s not in possible_hanging_squares]
 
-            if (len(capturable_pieces_by_lower) > 0) and (not position_after_move.is_check())  and (not is_possible_trade(board, move)):
+            if (len(capturable_pieces_by_lower) > 0) and (not position_after_move.is_check())  and (not is_possible_trade(board, move, features=features)):
                 capturable_pieces_by_lower = [piece_dict[str(position_after_move.piece_at(s)).lower()] for s in capturable_pieces_by_lower]
                 review += f'Um(a) {format_item_list(capturable_pieces_by_lower)} pode ser capturado por uma peça de menor valor. '
 
-            possible_forking_moves = move_allows_fork(board, move, return_forking_moves=True)
+            possible_forking_moves = move_allows_fork(board, move, return_forking_moves=True, features=features)
             
             if get_best_move_persistent(position_after_move, engine) in possible_forking_moves: # <<< MUDANÇA AQUI!
                 review += 'Esse movimento deixa peças vulneráveis a um garfo. '
 
-            missed_forks = move_misses_fork(board, move, return_forking_moves=True)
+            missed_forks = move_misses_fork(board, move, return_forking_moves=True, features=features)
             if (best_move in missed_forks) and (move != best_move):
                 review += f'Esse foi um garfo perdido com {board.san(best_move)}. '
 
-            missed_pins = move_misses_pin(board, move, return_pin_move=True)
+            missed_pins = move_misses_pin(board, move, return_pin_move=True, features=features)
             if (best_move in missed_pins) and (move != best_move):
                 review += f"Houve um pino perdido no movimento anterior com {board.san(best_move)}. "
 
-            missed_free_captures = move_misses_free_piece(board, move, return_free_captures=True)
+            missed_free_captures = move_misses_free_piece(board, move, return_free_captures=True, features=features)
             if len(missed_free_captures) > 0:
                 if (best_move in missed_free_captures) and (move != best_move):
                     review += f"Uma oportunidade de capturar um(a) {piece_dict[str(board.piece_at(best_move.to_square)).lower()]} foi perdida. "
@@ -1487,42 +2391,42 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
             # CHAVE DE MUDANÇA 2: Usa a versão persistente para o lance do oponente
             lets_opponent_play_move = get_best_move_persistent(position_after_move, engine) # <<< MUDANÇA AQUI!
 
-            if move_threatens_mate(board, best_move, engine=engine):
+            if move_threatens_mate(board, best_move, engine=engine, features=features):
                 review += 'Isso perde uma oportunidade de criar uma ameaça de xeque-mate. '
 
-            missed_attacked_piece = move_attacks_piece(board, best_move, return_attacked_piece=True)
+            missed_attacked_piece = move_attacks_piece(board, best_move, return_attacked_piece=True, features=features)
             if missed_attacked_piece is not False:
                 review += f'Uma chance de atacar um(a) {piece_dict[str(missed_attacked_piece).lower()]} com {board.san(best_move)} foi perdida. '
 
-            if move_attacks_piece(position_after_move, lets_opponent_play_move):
+            if move_attacks_piece(position_after_move, lets_opponent_play_move, features=features_after):
                 review += f'Isso permite o oponente atacar uma peça. '
 
-            attacked_squares_with_check = move_is_discovered_check_and_attacks(position_after_move, lets_opponent_play_move, return_attacked_squares=True)
+            attacked_squares_with_check = move_is_discovered_check_and_attacks(position_after_move, lets_opponent_play_move, return_attacked_squares=True, features=features_after)
             if len(attacked_squares_with_check) > 0:
                 attacked_pieces_with_check = [position_after_move.piece_at(s) for s in attacked_squares_with_check]
                 attacked_pieces_with_check = [piece_dict[str(p).lower()] for p in attacked_pieces_with_check]
                 review += f'Isso deixa o oponente ganhar um(a) {format_item_list(attacked_pieces_with_check)} por um xeque desoberto. '
 
-            missed_attacked_squares_with_check = move_is_discovered_check_and_attacks(board, best_move, return_attacked_squares=True)
+            missed_attacked_squares_with_check = move_is_discovered_check_and_attacks(board, best_move, return_attacked_squares=True, features=features)
             if len(missed_attacked_squares_with_check) > 0:
                 missed_attacked_pieces_with_check = [board.piece_at(s) for s in missed_attacked_squares_with_check]
                 missed_attacked_pieces_with_check = [piece_dict[str(p).lower()] for p in missed_attacked_pieces_with_check]
                 review += f'Isso perde a chance de atacar um(a) {format_item_list(missed_attacked_pieces_with_check)} por um xeque descoberto. '
 
             if not (len(attacked_squares_with_check) > 0):
-                trapped_squares = move_traps_opponents_piece(position_after_move, lets_opponent_play_move, return_trapped_squares=True)
+                trapped_squares = move_traps_opponents_piece(position_after_move, lets_opponent_play_move, return_trapped_squares=True, features=features_after)
                 if len(trapped_squares) > 0:
                     trapped_pieces = [position_after_move.piece_at(s) for s in trapped_squares]
                     trapped_pieces = [piece_dict[str(p).lower()] for p in trapped_pieces]
                     review += f'Isso permite um(a) {format_item_list(trapped_pieces)} ser presa. '
 
-            missed_trapped_squares = move_traps_opponents_piece(board, best_move, return_trapped_squares=True)
+            missed_trapped_squares = move_traps_opponents_piece(board, best_move, return_trapped_squares=True, features=features)
             if len(missed_trapped_squares) > 0:
                 missed_trapped_pieces = [board.piece_at(s) for s in missed_trapped_squares]
                 missed_trapped_pieces = [piece_dict[str(p).lower()] for p in missed_trapped_pieces]
                 review += f'Isso perde a chance de prender um(a) {format_item_list(missed_trapped_pieces)}. '
 
-            if move_wins_tempo(position_after_move, lets_opponent_play_move, engine=engine):
+            if move_wins_tempo(position_after_move, lets_opponent_play_move, engine=engine, multipv=multipv, features=features_after):
                 review += f'O oponente pode ganhar ritmo. '
 
             review += f"O oponente pode jogar {position_after_move.san(lets_opponent_play_move)}. "
@@ -1552,7 +2456,7 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
             move_classication = 'blunder'
             return move_classication, review, best_move, board.san(best_move)
         elif 'mates' in move_classication:
-            if is_possible_sacrifice(board, move):
+            if is_possible_sacrifice(board, move, features=features):
                 # Se for um Mate Forçado E um Sacrifício, promova para 'brilliant'
                 move_classication = 'brilliant'
                 review = review.replace('best', 'brilliant')
@@ -1631,22 +2535,32 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
             formatted_items = ", ".join(items[:-1]) + ", and " + items[-1]
             return formatted_items
 
-        position_after_move = board.copy()
-        position_after_move.push(move)
+        # Fatos das posições antes e depois do lance, compartilhados pelos detectores
+        if features is None:
+            features = FeatureContext(board, detectors)
+        features_after = features.after(move)
+        position_after_move = features_after.board
         
         review = ''
 
-        # CHANGE KEY 1: Uses the persistent version
-        best_move = get_best_move_persistent(board, engine) # <<< CHANGE HERE!
-
+        # Theory move: no search, the best move is the one of the book line itself
         if check_if_opening and (openings_df is not None):
-            opening = search_opening(openings_df, get_board_pgn(position_after_move))
+            opening = book_opening(position_after_move, openings_df)
             if opening is not None:
                 review = f'This is a theory move. The opening played is known as {opening}. '
-                return 'book', review, best_move, board.san(best_move)
+                return 'book', review, move, board.san(move)
+
+        # CHANGE KEY 1: Uses the persistent version
+        if multipv:
+            # One MultiPV search serves both the best move and the classification
+            analyse_position(board, engine, multipv=multipv)
+        best_move = get_best_move_persistent(board, engine) # <<< CHANGE HERE!
         
         # NOTE: You will need to ensure that 'classify_move' also uses the persistent 'engine' internally
-        move_classication = classify_move(board, move, engine) # <<< You will probably need to pass 'engine' to 'classify_move'
+        if classification is None:
+            move_classication = classify_move(board, move, engine, multipv=multipv) # <<< You will probably need to pass 'engine' to 'classify_move'
+        else:
+            move_classication = classification
 
         if move_classication in ['excellent', 'good']:
 
@@ -1656,14 +2570,14 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
             
             trade = False
 
-            if is_possible_trade(board, move) and not move_is_discovered_check(board, move):
+            if is_possible_trade(board, move, features=features) and not move_is_discovered_check(board, move, features=features):
                 if board.is_capture(move):
                     review += 'This is a trade. '
                 else:
                     review += 'This offers a trade. '
                 trade = True
 
-            defended_pieces = move_defends_hanging_piece(board, move, return_list_defended=True)
+            defended_pieces = move_defends_hanging_piece(board, move, return_list_defended=True, features=features)
             defended_squares = [chess.square_name(s) for s in defended_pieces]
             defended_pieces = [piece_dict_en[str(board.piece_at(s)).lower()] for s in defended_pieces]
 
@@ -1676,61 +2590,61 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
                 
                 review += f'This defends {format_item_list(defended_pieces)} on {format_item_list(defended_squares)}. '
 
-            possible_forked_squares = move_creates_fork(board, move, return_forked_squares=True)
+            possible_forked_squares = move_creates_fork(board, move, return_forked_squares=True, features=features)
             if len(possible_forked_squares) >= 2:
                 forked_pieces = [piece_dict_en[str(board.piece_at(s)).lower()] for s in possible_forked_squares]
                 review += f'This creates a fork on {format_item_list(forked_pieces)}. '
             else:
-                possible_attakced_piece = move_attacks_piece(board, move, return_attacked_piece=True)
+                possible_attakced_piece = move_attacks_piece(board, move, return_attacked_piece=True, features=features)
                 if possible_attakced_piece is not False:
                     review += f'This attacks a {piece_dict_en[str(possible_attakced_piece).lower()]}. '
 
 
-            if move_blocks_check(board, move):
+            if move_blocks_check(board, move, features=features):
                 review += f'This blocks a check on the king with a piece. '
 
-            developing = is_developing_move(board, move)
+            developing = is_developing_move(board, move, features=features)
             if developing is not False:
                 review += f'This develops a {piece_dict_en[developing.lower()]}. '
             
-            if is_fianchetto(board, move):
+            if is_fianchetto(board, move, features=features):
                 review += 'This fianchettos the bishop by placing it on a powerful diagonal. '
 
-            if move_pins_opponent(board, move):
+            if move_pins_opponent(board, move, features=features):
                 review += 'This pins an opponent\'s piece to their king. '
 
-            if moves_rook_to_open_file(board, move):
+            if moves_rook_to_open_file(board, move, features=features):
                 review += "By placing the rook on an open file, it controls important files. "
 
             if is_endgame(board):
-                if move_moves_king_off_backrank(board, move):
+                if move_moves_king_off_backrank(board, move, features=features):
                     review += "By moving the king off the back rank, the risk of back-rank mate threats is reduced and improves king safety. "
 
-            if move_wins_tempo(board, move, engine=engine):
+            if move_wins_tempo(board, move, engine=engine, multipv=multipv, features=features):
                 review += 'This move gains tempo. '
 
             if 'trade' not in previous_review:
 
-                if move_captures_higher_piece(board, move):
+                if move_captures_higher_piece(board, move, features=features):
                     review += f'This captures a piece of higher value than yours. '
 
                 if 'higher value piece' not in previous_review:
-                    if move_captures_free_piece(board, move):
+                    if move_captures_free_piece(board, move, features=features):
                         review += f'This captures a free {piece_dict_en[str(board.piece_at(move.to_square)).lower()]}. '
 
-            attacked_squares_with_check = move_is_discovered_check_and_attacks(board, move, return_attacked_squares=True)
+            attacked_squares_with_check = move_is_discovered_check_and_attacks(board, move, return_attacked_squares=True, features=features)
             if len(attacked_squares_with_check) > 0:
                 attacked_pieces_with_check = [board.piece_at(s) for s in attacked_squares_with_check]
                 attacked_pieces_with_check = [piece_dict_en[str(p).lower()] for p in attacked_pieces_with_check]
                 review += f'This creates a discovered check while attacking a {format_item_list(attacked_pieces_with_check)}. '
 
-            trapped_squares = move_traps_opponents_piece(board, move, return_trapped_squares=True)
+            trapped_squares = move_traps_opponents_piece(board, move, return_trapped_squares=True, features=features)
             if len(trapped_squares) > 0:
                 trapped_pieces = [board.piece_at(s) for s in trapped_squares]
                 trapped_pieces = [piece_dict_en[str(p).lower()] for p in trapped_pieces]
                 review += f'This traps a {format_item_list(trapped_pieces)}. '
 
-            if is_possible_sacrifice(board, move):
+            if is_possible_sacrifice(board, move, features=features):
                 #if move_classication != 'good':
                 move_classication = 'brilliant'
                 review = review.replace('best', 'brilliant')
@@ -1738,7 +2652,7 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
                 review = review.replace('excellent', 'brilliant')
                 review += f'This sacrifices the {piece_dict_en[str(board.piece_at(move.from_square)).lower()]}. '
 
-            if move_threatens_mate(board, move, engine=engine):
+            if move_threatens_mate(board, move, engine=engine, features=features):
                 review += 'This creates a checkmate threat. '
 
 
@@ -1747,9 +2661,9 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
 
             possible_hanging_squares = []
             if ('creates a fork' not in previous_review) or (not board.is_check()) or ('trade' not in previous_review) or ('lower value' not in previous_review):
-                possible_hanging_squares = move_hangs_piece(board, move, return_hanging_squares=True)
+                possible_hanging_squares = move_hangs_piece(board, move, return_hanging_squares=True, features=features)
 
-                if is_possible_trade(board, move):
+                if is_possible_trade(board, move, features=features):
                     if move.to_square in possible_hanging_squares:
                         del possible_hanging_squares[possible_hanging_squares.index(move.to_square)]
 
@@ -1759,27 +2673,27 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
                     hanging_pieces = [piece_dict_en[str(position_after_move.piece_at(s)).lower()] for s in possible_hanging_squares]
                     review += f'This move leaves {format_item_list(hanging_pieces)} hanging on {format_item_list(hanging_squares)}. '
 
-            capturable_pieces_by_lower = check_for_capturable_pieces_by_lower(position_after_move)
+            capturable_pieces_by_lower = check_for_capturable_pieces_by_lower(position_after_move, features=features_after)
             capturable_pieces_by_lower = [s for s in capturable_pieces_by_lower if s not in possible_hanging_squares]
 
-            if (len(capturable_pieces_by_lower) > 0) and (not position_after_move.is_check())  and (not is_possible_trade(board, move)):
+            if (len(capturable_pieces_by_lower) > 0) and (not position_after_move.is_check())  and (not is_possible_trade(board, move, features=features)):
                 capturable_pieces_by_lower = [piece_dict_en[str(position_after_move.piece_at(s)).lower()] for s in capturable_pieces_by_lower]
                 review += f'A {format_item_list(capturable_pieces_by_lower)} can be captured by a lower value piece. '
 
-            possible_forking_moves = move_allows_fork(board, move, return_forking_moves=True)
+            possible_forking_moves = move_allows_fork(board, move, return_forking_moves=True, features=features)
             
             if get_best_move_persistent(position_after_move, engine) in possible_forking_moves: # <<< CHANGE HERE!
                 review += 'This move leaves pieces vulnerable to a fork. '
 
-            missed_forks = move_misses_fork(board, move, return_forking_moves=True)
+            missed_forks = move_misses_fork(board, move, return_forking_moves=True, features=features)
             if (best_move in missed_forks) and (move != best_move):
                 review += f'This was a missed fork with {board.san(best_move)}. '
 
-            missed_pins = move_misses_pin(board, move, return_pin_move=True)
+            missed_pins = move_misses_pin(board, move, return_pin_move=True, features=features)
             if (best_move in missed_pins) and (move != best_move):
                 review += f"There was a missed pin in the previous move with {board.san(best_move)}. "
 
-            missed_free_captures = move_misses_free_piece(board, move, return_free_captures=True)
+            missed_free_captures = move_misses_free_piece(board, move, return_free_captures=True, features=features)
             if len(missed_free_captures) > 0:
                 if (best_move in missed_free_captures) and (move != best_move):
                     review += f"A chance to capture a {piece_dict_en[str(board.piece_at(best_move.to_square)).lower()]} was missed. "
@@ -1787,42 +2701,42 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
             # CHANGE KEY 2: Uses the persistent version for the opponent's move
             lets_opponent_play_move = get_best_move_persistent(position_after_move, engine) # <<< CHANGE HERE!
 
-            if move_threatens_mate(board, best_move, engine=engine):
+            if move_threatens_mate(board, best_move, engine=engine, features=features):
                 review += 'This misses an opportunity to create a checkmate threat. '
 
-            missed_attacked_piece = move_attacks_piece(board, best_move, return_attacked_piece=True)
+            missed_attacked_piece = move_attacks_piece(board, best_move, return_attacked_piece=True, features=features)
             if missed_attacked_piece is not False:
                 review += f'A chance to attack a {piece_dict_en[str(missed_attacked_piece).lower()]} with {board.san(best_move)} was missed. '
 
-            if move_attacks_piece(position_after_move, lets_opponent_play_move):
+            if move_attacks_piece(position_after_move, lets_opponent_play_move, features=features_after):
                 review += f'This allows the opponent to attack a piece. '
 
-            attacked_squares_with_check = move_is_discovered_check_and_attacks(position_after_move, lets_opponent_play_move, return_attacked_squares=True)
+            attacked_squares_with_check = move_is_discovered_check_and_attacks(position_after_move, lets_opponent_play_move, return_attacked_squares=True, features=features_after)
             if len(attacked_squares_with_check) > 0:
                 attacked_pieces_with_check = [position_after_move.piece_at(s) for s in attacked_squares_with_check]
                 attacked_pieces_with_check = [piece_dict_en[str(p).lower()] for p in attacked_pieces_with_check]
                 review += f'This lets the opponent win a {format_item_list(attacked_pieces_with_check)} with a discovered check. '
 
-            missed_attacked_squares_with_check = move_is_discovered_check_and_attacks(board, best_move, return_attacked_squares=True)
+            missed_attacked_squares_with_check = move_is_discovered_check_and_attacks(board, best_move, return_attacked_squares=True, features=features)
             if len(missed_attacked_squares_with_check) > 0:
                 missed_attacked_pieces_with_check = [board.piece_at(s) for s in missed_attacked_squares_with_check]
                 missed_attacked_pieces_with_check = [piece_dict_en[str(p).lower()] for p in missed_attacked_pieces_with_check]
                 review += f'This misses the chance to attack a {format_item_list(missed_attacked_pieces_with_check)} with a discovered check. '
 
             if not (len(attacked_squares_with_check) > 0):
-                trapped_squares = move_traps_opponents_piece(position_after_move, lets_opponent_play_move, return_trapped_squares=True)
+                trapped_squares = move_traps_opponents_piece(position_after_move, lets_opponent_play_move, return_trapped_squares=True, features=features_after)
                 if len(trapped_squares) > 0:
                     trapped_pieces = [position_after_move.piece_at(s) for s in trapped_squares]
                     trapped_pieces = [piece_dict_en[str(p).lower()] for p in trapped_pieces]
                     review += f'This allows a {format_item_list(trapped_pieces)} to be trapped. '
 
-            missed_trapped_squares = move_traps_opponents_piece(board, best_move, return_trapped_squares=True)
+            missed_trapped_squares = move_traps_opponents_piece(board, best_move, return_trapped_squares=True, features=features)
             if len(missed_trapped_squares) > 0:
                 missed_trapped_pieces = [board.piece_at(s) for s in missed_trapped_squares]
                 missed_trapped_pieces = [piece_dict_en[str(p).lower()] for p in missed_trapped_pieces]
                 review += f'This misses the chance to trap a {format_item_list(missed_trapped_pieces)}. '
 
-            if move_wins_tempo(position_after_move, lets_opponent_play_move, engine=engine):
+            if move_wins_tempo(position_after_move, lets_opponent_play_move, engine=engine, multipv=multipv, features=features_after):
                 review += f'The opponent can gain tempo. '
 
             review += f"The opponent can play {position_after_move.san(lets_opponent_play_move)}. "
@@ -1852,7 +2766,7 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
             move_classication = 'blunder'
             return move_classication, review, best_move, board.san(best_move)
         elif 'mates' in move_classication:
-            if is_possible_sacrifice(board, move):
+            if is_possible_sacrifice(board, move, features=features):
                 # If it is a Forced Mate AND a Sacrifice, promote to 'brilliant'
                 move_classication = 'brilliant'
                 review = review.replace('best', 'brilliant')
@@ -1922,6 +2836,7 @@ def review_move(board: chess.Board, move, previous_review: str, check_if_opening
         return move_classication, review, best_move, board.san(best_move)
 
 def get_board_pgn(board: chess.Board):
+    import chess.pgn
     game = chess.pgn.Game()
     node = game
 
@@ -1935,7 +2850,187 @@ def get_board_pgn(board: chess.Board):
 
 # NO ARQUIVO: saulochess/chess_review.py
 
-def review_game(uci_moves, roast=False, verbose=False, engine=None, language=None): 
+def review_ply(board: chess.Board, move, ply, previous_review, roast=False, engine=None, language=None, multipv=None, openings_df=None):
+    """Reviews one ply of a game, returning the played-move review and the best-move review."""
+
+    if ply < OPENING_PLIES:
+        check_if_opening = True
+    else:
+        check_if_opening = False
+
+    # Compartilhado pela review do lance jogado e pela do melhor lance
+    features = FeatureContext(board, active_config().detectors)
+
+    # -----------------------------------------------------
+    # 🚨 CORREÇÃO PRINCIPAL: TRATAMENTO DE ERROS NA REVIEW_MOVE
+    # -----------------------------------------------------
+    try:
+        # Tenta analisar o lance jogado
+        if roast:
+            # Se roast for True, você pode ter uma função roast_move separada ou usar review_move
+            classification, review, uci_best_move, san_best_move = review_move(
+                board, move, previous_review, check_if_opening, engine=engine, language=language, multipv=multipv,
+                openings_df=openings_df, features=features
+            )
+        else:
+            classification, review, uci_best_move, san_best_move = review_move(
+                board, move, previous_review, check_if_opening, engine=engine, language=language, multipv=multipv,
+                openings_df=openings_df, features=features
+            )
+
+    except Exception as e:
+        # Se review_move falhar (timeout, erro do Stockfish), define valores seguros
+        classification = 'ERROR'
+        review = f'Falha interna na análise do lance: {e}'
+        uci_best_move = ''
+        san_best_move = ''
+        print(f"\n[AVISO] Erro no lance {ply+1} ({move}): {e}") # Apenas para debug
+        report_error('ply', e, ply=ply, move=move.uci())
+
+
+    # OBTENÇÃO DA MELHOR REVISÃO
+    best_review = ''
+    if classification not in ['book', 'best']:
+
+        # Se a análise do lance jogado FALHOU, não podemos obter a melhor review
+        mode = active_config().best_reviews
+        if uci_best_move and mode == 'lazy':
+            best_review = None # escrita só quando pedida, ver GameReview.best_review
+        elif uci_best_move and mode == 'eager':
+            try:
+                # review_move já devolve o melhor lance como objeto Move
+                best_review = review_best_move(
+                    board,
+                    uci_best_move,
+                    previous_review,
+                    check_if_opening,
+                    engine=engine,
+                    language=language,
+                    multipv=multipv,
+                    openings_df=openings_df,
+                    features=features
+                )
+            except Exception as e:
+                best_review = f'Falha ao obter melhor review: {e}'
+                report_error('best_review', e, ply=ply, move=move.uci())
+        elif not uci_best_move:
+             best_review = 'Não foi possível analisar o lance ou o melhor lance.'
+
+    return classification, review, best_review, uci_best_move, san_best_move
+
+def review_best_move(board: chess.Board, best_move, previous_review, check_if_opening=False, engine=None, language='en', multipv=None, openings_df=None, features=None):
+    """Review of the engine's best move in board, classified from the search that found it.
+
+    features is the FeatureContext of the played move's review: the position facts and the
+    detectors it already ran on the best move (missed forks, pins, attacks...) are reused.
+    """
+    _, best_review, _, _ = review_move(
+        board, best_move, previous_review, check_if_opening, engine=engine, language=language, multipv=multipv,
+        openings_df=openings_df, features=features, classification=classify_best_move(board, engine)
+    )
+    return best_review
+
+def best_review_at(uci_moves, ply, previous_review, engine=None, language='en', openings_df=None, config=None, best_move=None):
+    """The best-move review review_ply would write for uci_moves[ply], for reviews made with
+    best_reviews='lazy'. With the engine and AnalysisConfig of the review, the searches it needs
+    are normally still in analysis_cache.
+
+    best_move is the best move stored with the review; without it the position is searched
+    again, and a time-limited search may pick another move than the one shown.
+    """
+    board = chess.Board()
+    for move in uci_moves[:ply]:
+        board.push(move)
+
+    with using_config(active_config(config)) as config:
+        if best_move is None:
+            best_move = get_best_move_persistent(board, engine)
+        return review_best_move(
+            board, best_move, previous_review, ply < OPENING_PLIES, engine=engine, language=language,
+            multipv=config.multipv, openings_df=openings_df
+        )
+
+def prefetch_game_analyses(uci_moves, engines, multipv=None, config=None, openings_df=None):
+    """Searches the positions a game review needs, spreading them over several engines.
+
+    All positions of the game are known up front, so they are searched in parallel first;
+    a second wave searches what the review derives from those results (the null-move
+    positions move_threatens_mate uses, after the played and after the best move; the
+    best-move review needs no search of the position after the best move). Results land
+    in analysis_cache, so the sequential review that follows only reads them back.
+    Book moves (see is_book_ply) and the CPL positions of the book plies at the start
+    of the game (see book_plies) are not searched.
+    """
+    # The worker threads do not see this thread's active config, so it is passed explicitly
+    config = active_config(config)
+    instruments = instrumentation.active_instrumentation()
+    idle_engines = queue.Queue()
+    for engine in engines:
+        idle_engines.put(engine)
+
+    def search(board):
+        engine = idle_engines.get()
+        try:
+            with instrumentation.using_instrumentation(instruments):
+                if multipv:
+                    return analyse_position(board, engine, multipv=multipv, config=config)[0]
+                return analyse_position(board, engine, config=config)
+        except Exception:
+            # A revisão sequencial refaz a busca e trata o erro no lance certo
+            return None
+        finally:
+            idle_engines.put(engine)
+
+    def null_move_position(board):
+        if board.is_check():
+            return None
+        board = board.copy()
+        board.push(chess.Move.null())
+        return board
+
+    board = chess.Board()
+    positions = [board.copy()]
+    for move in uci_moves:
+        board.push(move)
+        positions.append(board.copy())
+
+    # review_ply searches the positions before and after each move it does not classify as
+    # book; the CPL searches the position where the book ends and every position after it
+    book = book_plies(uci_moves, openings_df)
+    reviewed = [ply for ply in range(len(uci_moves)) if not is_book_ply(positions[ply + 1], ply, openings_df)]
+    searched = set(range(book, len(positions)))
+    for ply in reviewed:
+        searched.update((ply, ply + 1))
+    searched = sorted(searched)
+
+    with ThreadPoolExecutor(max_workers=len(engines)) as executor:
+        infos = [None] * len(positions)
+        for index, info in zip(searched, executor.map(search, [positions[index] for index in searched])):
+            infos[index] = info
+
+        followups = []
+        for ply in reviewed:
+            followups.append(null_move_position(positions[ply + 1]))
+
+            info = infos[ply]
+            if info is not None and info.get('pv'):
+                position_after_best = positions[ply].copy()
+                position_after_best.push(info['pv'][0])
+                followups.append(null_move_position(position_after_best))
+
+        list(executor.map(search, [b for b in followups if b is not None]))
+
+def print_verbose_ply(move, review, uci_best_move, best_review):
+    print(move, end='')
+    print(' | ', end='')
+    print(review)
+    print('')
+    print(uci_best_move, end='')
+    print(' | ', end='')
+    print(best_review)
+    print('')
+
+def review_game(uci_moves, roast=False, verbose=False, engine=None, language=None, multipv=None, openings_df=None): 
     # 🚨 Certifique-se de que a variável 'engine' está aqui
 
     if engine is None:
@@ -1949,89 +3044,117 @@ def review_game(uci_moves, roast=False, verbose=False, engine=None, language=Non
     review_list = []
     best_review_list = []
 
-    # O loop tqdm é mantido
-    for i, move in enumerate(tqdm(uci_moves)):
-
-        if i < 11:
-            check_if_opening = True
-        else:
-            check_if_opening = False
+    # O progresso vai para o reporter de instrumentation (tqdm por padrão)
+    for i, move in enumerate(instrumentation.track(uci_moves)):
 
         if len(review_list) == 0:
             previous_review = None
         else:
             previous_review = review_list[-1]
-        
-        # -----------------------------------------------------
-        # 🚨 CORREÇÃO PRINCIPAL: TRATAMENTO DE ERROS NA REVIEW_MOVE
-        # -----------------------------------------------------
-        try:
-            # Tenta analisar o lance jogado
-            if roast:
-                # Se roast for True, você pode ter uma função roast_move separada ou usar review_move
-                classification, review, uci_best_move, san_best_move = review_move(
-                    board, move, previous_review, check_if_opening, engine=engine, language=language
-                )
-            else:
-                classification, review, uci_best_move, san_best_move = review_move(
-                    board, move, previous_review, check_if_opening, engine=engine, language=language
-                )
 
-        except Exception as e:
-            # Se review_move falhar (timeout, erro do Stockfish), define valores seguros
-            classification = 'ERROR'
-            review = f'Falha interna na análise do lance: {e}'
-            uci_best_move = ''
-            san_best_move = ''
-            print(f"\n[AVISO] Erro no lance {i+1} ({move}): {e}") # Apenas para debug
+        classification, review, best_review, uci_best_move, san_best_move = review_ply(
+            board, move, i, previous_review, roast, engine=engine, language=language, multipv=multipv,
+            openings_df=openings_df
+        )
 
+        classification_list.append(classification)
+        review_list.append(review)
+        best_review_list.append(best_review)
+        uci_best_moves.append(uci_best_move)
+        san_best_moves.append(san_best_move)
         
-        # OBTENÇÃO DA MELHOR REVISÃO
-        best_review = ''
-        if classification not in ['book', 'best']:
+        # Lógica de 'verbose' (mantida)
+        if verbose:
+            print_verbose_ply(move, review, uci_best_move, best_review)
             
-            # Se a análise do lance jogado FALHOU, não podemos obter a melhor review
-            if uci_best_move:
-                try:
-                    # 🚨 Corrigindo a conversão de string UCI para objeto move
-                    best_move_obj = board.parse_uci(uci_best_move)
-                    
-                    # A chamada para review_move para o best_review
-                    _, best_review, _, _ = review_move(
-                        board, 
-                        best_move_obj, # <<< AGORA PASSA O OBJETO MOVE CORRETO
-                        previous_review, 
-                        check_if_opening, 
-                        engine=engine,
-                        language=language
-                    )
-                except Exception as e:
-                    best_review = f'Falha ao obter melhor review: {e}'
-            else:
-                 best_review = 'Não foi possível analisar o lance ou o melhor lance.'
+        board.push(move)
+
+    return review_list, best_review_list, classification_list, uci_best_moves, san_best_moves
+
+def analyse_game(uci_moves, roast=False, verbose=False, engine=None, language=None, multipv=None, openings_df=None):
+    """Single pass over the game producing both the compute_cpl and the review_game results.
+
+    Every position of the game is searched once. The search of the position after ply N
+    is the played-move evaluation of ply N and the best-play evaluation of ply N+1, and
+    review_move reads the same searches back from analysis_cache. The book plies at the
+    start of the game (see book_plies) are not searched and count as 0 CPL.
+    """
+
+    if engine is None:
+        raise ValueError("O motor (engine) deve ser passado para analyse_game para performance rápida.")
+
+    board = chess.Board()
+
+    scores = []
+    cpls_white = []
+    cpls_black = []
+    san_best_moves = []
+    uci_best_moves = []
+    classification_list = []
+    review_list = []
+    best_review_list = []
+    devs = []
+    mobs = []
+    tens = []
+    conts = []
 
+    # Book plies are not searched: all of them get the score of the position where the book ends
+    book = book_plies(uci_moves, openings_df)
+    score_best = evaluate_for_cpl(book_position(uci_moves, book), engine, multipv)
 
+    for i, move in enumerate(instrumentation.track(uci_moves)):
+
+        if len(review_list) == 0:
+            previous_review = None
+        else:
+            previous_review = review_list[-1]
+
+        # Searching the next position first lets the review read its best reply from the same search
+        position_after_move = board.copy()
+        position_after_move.push(move)
+        if i < book:
+            score_player = score_best
+        else:
+            score_player = evaluate_for_cpl(position_after_move, engine, multipv)
+
+        classification, review, best_review, uci_best_move, san_best_move = review_ply(
+            board, move, i, previous_review, roast, engine=engine, language=language, multipv=multipv,
+            openings_df=openings_df
+        )
 
         classification_list.append(classification)
         review_list.append(review)
         best_review_list.append(best_review)
         uci_best_moves.append(uci_best_move)
         san_best_moves.append(san_best_move)
-        
-        # Lógica de 'verbose' (mantida)
+
         if verbose:
-            print(move, end='')
-            print(' | ', end='')
-            print(review)
-            print('')
-            print(uci_best_move, end='')
-            print(' | ', end='')
-            print(best_review)
-            print('')
-            
+            print_verbose_ply(move, review, uci_best_move, best_review)
+
         board.push(move)
+        scores.append(score_player)
 
-    return review_list, best_review_list, classification_list, uci_best_moves, san_best_moves
+        dev, mob, ten, cont = position_metrics(board)
+        devs.append(dev)
+        mobs.append(mob)
+        tens.append(ten)
+        conts.append(cont)
+
+        if i%2 == 0:
+            cpls_white.append(abs(score_best - score_player))
+        else:
+            cpls_black.append(abs(score_best - score_player))
+
+        score_best = score_player
+
+    average_cpl_white = sum(cpls_white)/len(cpls_white)
+    average_cpl_black = sum(cpls_black)/len(cpls_black)
+
+    return (
+        scores, cpls_white, cpls_black, average_cpl_white, average_cpl_black,
+        review_list, best_review_list, classification_list, uci_best_moves, san_best_moves,
+        (devs, mobs, tens, conts)
+    )
 
 def seperate_squares_in_move_list(uci_moves: list):
     seperated_squares = []
@@ -2042,76 +3165,183 @@ def seperate_squares_in_move_list(uci_moves: list):
 
     return seperated_squares
 
-@lru_cache(maxsize=128)
-def pgn_game_review(pgn_data: str, roast: bool, limit_type: str, time_limit: float, depth_limit: int, engine=None, language='en'):
+def summarize_game_review(uci_moves, fens, scores, average_cpl_white, average_cpl_black,
+                          review_list, best_review_list, classification_list, uci_best_moves,
+                          metrics=None, initial_score=0):
+    # metrics: (devs, mobs, tens, conts) já calculados durante a análise; senão são calculados a partir das FENs
+    # initial_score: base da precisão, veja opening_score
+    n_moves = len(scores)//2
+    white_elo_est, black_elo_est = estimate_elo(average_cpl_white, n_moves), estimate_elo(average_cpl_black, n_moves)
+    white_acc, black_acc = calculate_accuracy(scores, initial_score)
+    if metrics is None:
+        metrics = calculate_metrics(fens)
+
+    from saulochess.review_result import GameReview
+    return GameReview.from_lists(
+        uci_moves, scores, classification_list, review_list, best_review_list, uci_best_moves, metrics,
+        white_acc, black_acc, white_elo_est, black_elo_est, average_cpl_white, average_cpl_black
+    )
+
+# Reviews already computed, returned as copies; None disables the cache.
+review_cache = ReviewCache(maxsize=128)
+
+def cache_stats():
+    """Counters (hits, misses, hit_rate...) of every cache in use, by name."""
+    stats = {
+        'analysis': analysis_cache.stats(),
+        'forks': fork_cache.stats(),
+        'openings': compiled_openings.stats(),
+    }
+    if review_cache is not None:
+        stats['reviews'] = review_cache.stats()
+    if eval_store is not None:
+        stats['eval_store'] = eval_store.stats()
+    return stats
+
+def report_error(stage, error, **context):
+    instruments = instrumentation.active_instrumentation()
+    if instruments is not None:
+        instruments.error(stage, error, **context)
+
+def review_cache_key(uci_moves, roast, config, engine=None, language='en', openings_df=None):
+    openings = opening_index(openings_df)
+    return review_key(
+        tuple(move.uci() for move in uci_moves), bool(roast), config.review_key(), language, config.multipv,
+        engine_identity(engine), openings.fingerprint() if openings is not None else None
+    )
+
+def pgn_game_review(pgn_data: str, roast: bool, limit_type: str, time_limit: float, depth_limit: int, engine=None, language='en', parallel_engines=None, multipv=None, openings_df=None, config=None):
     # 🚨 CORREÇÃO: ADICIONADO 'engine=None' para aceitar o motor do seu teste.py
-    global STOCKFISH_CONFIG
+    # parallel_engines: tupla de motores abertos, ou um inteiro K para abrir K motores,
+    # sobre os quais as buscas dos lances são distribuídas antes da revisão.
+    # multipv: classifica cada lance a partir de uma única busca MultiPV com esse número de linhas.
+    # openings_df: um DataFrame de aberturas ou um OpeningIndex.
+    # O resultado fica no review_cache, indexado pelos lances (não pelo texto do PGN) e pelo motor.
+    # config: uma AnalysisConfig; quando passada, substitui limit_type, time_limit, depth_limit e multipv.
+    if config is None:
+        config = AnalysisConfig.from_limits(limit_type, time_limit, depth_limit, multipv=multipv)
+
+    uci_moves, san_moves, fens = parse_pgn(pgn_data)
+
+    cache = review_cache
+    if cache is not None:
+        key = review_cache_key(uci_moves, roast, config, engine, language, openings_df)
+        cached = cache.get(key)
+        if cached is not None:
+            cached.cache_key = key
+            return cached
+
+    result = review_parsed_game(
+        uci_moves, san_moves, fens, roast, limit_type, time_limit, depth_limit,
+        engine=engine, language=language, parallel_engines=parallel_engines, openings_df=openings_df, config=config
+    )
+
+    # Falhas não ficam no cache: a próxima chamada tenta de novo
+    if cache is not None and not result.failed:
+        cache.put(key, result)
+        result.cache_key = key
+    return result
+
+def review_parsed_game(uci_moves, san_moves, fens, roast: bool, limit_type: str, time_limit: float, depth_limit: int, engine=None, language='en', parallel_engines=None, multipv=None, openings_df=None, config=None):
+    # Corpo de pgn_game_review sem o review_cache, para partidas já lidas (ver parse_pgn e replay_moves).
     global stockfish_path 
 
-    # 1. ATUALIZA A CONFIGURAÇÃO
-    if limit_type == "time":
-        STOCKFISH_CONFIG = {'time': float(time_limit)}
-    else:
-        STOCKFISH_CONFIG = {'depth': int(depth_limit)}
+    # 1. CONFIGURAÇÃO DA ANÁLISE: vale só para esta revisão (não altera STOCKFISH_CONFIG)
+    if config is None:
+        config = AnalysisConfig.from_limits(limit_type, time_limit, depth_limit, multipv=multipv)
+    multipv = config.multipv
 
-    uci_moves, san_moves, fens = parse_pgn(pgn_data)
-    
-    # Gerenciamento do Motor
-    local_engine = engine
-    should_close_engine = False
+    with using_config(config):
+        # Gerenciamento do Motor
+        import chess.engine
+        from saulochess import engine_pool
+        local_engine = engine
+        pool = None
 
-    # 2. ABRE O MOTOR SE NÃO FOI PASSADO (fluxo do seu site)
-    if local_engine is None:
+        # 2. SEM MOTOR, EMPRESTA UM DO POOL DO PROCESSO (aberto e aquecido uma única vez)
+        if local_engine is None:
+            try:
+                pool = engine_pool.default_pool()
+                local_engine = pool.acquire()
+            except Exception as e:
+                # Se nem abrir o motor falhar, retorna valores seguros.
+                print(f"Erro Crítico ao abrir o Stockfish em {stockfish_path}: {e}")
+                report_error('engine_open', e, path=stockfish_path)
+                raise e # Levanta o erro para que o teste.py possa capturá-lo
+
+        extra_pool = None
+        leased_engines = []  # do pool, devolvidos no fim
+        extra_engines = []   # abertos só para esta revisão, com as opções do pool
+        configured = {}      # motor -> opções anteriores, restauradas no fim
+        engine_failed = False
         try:
-            local_engine = chess.engine.SimpleEngine.popen_uci(stockfish_path)
-            should_close_engine = True
-        except Exception as e:
-            # Se nem abrir o motor falhar, retorna valores seguros.
-            print(f"Erro Crítico ao abrir o Stockfish em {stockfish_path}: {e}")
-            raise e # Levanta o erro para que o teste.py possa capturá-lo
-
-    try:
-        # 3. CHAMA COMPUTE_CPL PASSANDO O MOTOR ABERTO
-        scores, cpls_white, cpls_black, average_cpl_white, average_cpl_black = compute_cpl(
-            uci_moves, 
-            local_engine
-        )
-        
-        # 4. CHAMA review_game PASSANDO O MOTOR ABERTO
-        # Certifique-se de que a assinatura de review_game também aceita 'engine'
-        review_list, best_review_list, classification_list, uci_best_moves, san_best_moves = review_game(
-            uci_moves, 
-            roast, 
-            engine=local_engine,
-            language=language
-        )
+            # As engine_options da config valem para a revisão inteira: cada motor é configurado uma vez
+            configured[local_engine] = configure_engine(local_engine, config.engine_options)
+
+            # 2b. BUSCAS EM PARALELO, SE PEDIDO
+            if parallel_engines:
+                if isinstance(parallel_engines, int):
+                    extra_pool = engine_pool.default_pool()
+                    for _ in range(parallel_engines - 1):
+                        extra_engine = extra_pool.acquire(timeout=0)
+                        if extra_engine is None:
+                            # todos os motores do pool estão emprestados: um avulso, configurado e aquecido como os dele
+                            extra_engines.append(extra_pool.open_spare())
+                        else:
+                            leased_engines.append(extra_engine)
+                    prefetch_engines = [local_engine] + leased_engines + extra_engines
+                else:
+                    prefetch_engines = list(parallel_engines)
+                for prefetch_engine in prefetch_engines:
+                    if prefetch_engine not in configured:
+                        configured[prefetch_engine] = configure_engine(prefetch_engine, config.engine_options)
+                prefetch_game_analyses(uci_moves, prefetch_engines, multipv, config, openings_df)
+
+            # 3. UMA ÚNICA PASSADA: CPL, SCORES E REVIEW A PARTIR DAS MESMAS BUSCAS
+            (
+                scores, cpls_white, cpls_black, average_cpl_white, average_cpl_black,
+                review_list, best_review_list, classification_list, uci_best_moves, san_best_moves, metrics
+            ) = analyse_game(
+                uci_moves,
+                roast,
+                engine=local_engine,
+                language=language,
+                multipv=multipv,
+                openings_df=openings_df
+            )
 
-    except Exception as e:
-        # Lidar com erros de Stockfish ou outros (Onde o erro de NoneType ocorria)
-        print(f"Erro na análise do Stockfish: {e}")
+        except Exception as e:
+            # Lidar com erros de Stockfish ou outros (Onde o erro de NoneType ocorria)
+            print(f"Erro na análise do Stockfish: {e}")
+            report_error('review', e, plies=len(uci_moves))
+            # o motor pode ter ficado num estado ruim: os emprestados não voltam para o pool
+            engine_failed = isinstance(e, (chess.engine.EngineError, chess.engine.EngineTerminatedError))
         
-        # 🚨 CORREÇÃO ESSENCIAL: Retorna valores vazios/seguros em caso de falha.
-        return (
-            san_moves, fens, [0]*len(san_moves), ['error']*len(san_moves), ['Análise Falhou'], ['Análise Falhou'],
-            ['?'], ['?'], [0]*len(fens), [0]*len(fens), [0]*len(fens), [0]*len(fens),
-            0.0, 0.0, 0, 0, 0.0, 0.0 # Accuracies, ELOs, CPLs zerados
+            # 🚨 CORREÇÃO ESSENCIAL: Retorna valores vazios/seguros em caso de falha.
+            from saulochess.review_result import GameReview
+            return GameReview.from_failure(uci_moves)
+
+        finally:
+            # 4. RESTAURA AS OPÇÕES DOS MOTORES; um motor que não aceita mais comandos está quebrado
+            broken = set()
+            for configured_engine, previous in configured.items():
+                if previous:
+                    try:
+                        configured_engine.configure(previous)
+                    except Exception:
+                        broken.add(configured_engine)
+
+            # 5. DEVOLVE AO POOL OS MOTORES EMPRESTADOS E FECHA OS ABERTOS NESTA FUNÇÃO
+            if pool is not None:
+                pool.release(local_engine, engine_failed or local_engine in broken)
+            for extra_engine in leased_engines:
+                extra_pool.release(extra_engine, engine_failed or extra_engine in broken)
+            for extra_engine in extra_engines:
+                extra_pool.close_spare(extra_engine)
+
+        # 6. O RESTANTE DO CÓDIGO PERMANECE O MESMO
+        return summarize_game_review(
+            uci_moves, fens, scores, average_cpl_white, average_cpl_black,
+            review_list, best_review_list, classification_list, uci_best_moves, metrics,
+            opening_score(scores, uci_moves, openings_df)
         )
-
-    finally:
-        # 5. FECHA O MOTOR APENAS SE ELE FOI ABERTO NESTA FUNÇÃO
-        if should_close_engine:
-            local_engine.quit()
-
-    # 6. O RESTANTE DO CÓDIGO PERMANECE O MESMO
-    n_moves = len(scores)//2
-    white_elo_est, black_elo_est = estimate_elo(average_cpl_white, n_moves), estimate_elo(average_cpl_black, n_moves)
-    white_acc, black_acc = calculate_accuracy(scores)
-    devs, mobs, tens, conts = calculate_metrics(fens)
-
-    uci_best_moves = seperate_squares_in_move_list(uci_best_moves)
-
-    return (
-                san_moves, fens, scores, classification_list, review_list, best_review_list,
-                san_best_moves, uci_best_moves, devs, tens, mobs, conts,
-                white_acc, black_acc, white_elo_est, black_elo_est, average_cpl_white, average_cpl_black
-            )
\ No newline at end of file
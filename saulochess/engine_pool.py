@@ -0,0 +1,299 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import chess
+import chess.engine
+
+
+# Every engine opened by a pool and not closed yet, leased or not, with the pid that opened it (see close_engines)
+open_engines = {}
+
+
+def engine_options(options=None, threads=None, hash=None):
+    options = dict(options or {})
+    if threads is not None:
+        options['Threads'] = threads
+    if hash is not None:
+        options['Hash'] = hash
+    return options
+
+
+def pool_identity(command, options):
+    # o que distingue os resultados de um pool nas chaves do review_cache, no formato de engine_identity
+    if not options:
+        return command
+    return command, tuple(sorted((str(name), repr(value)) for name, value in options.items()))
+
+
+class EnginePool:
+    """UCI engines kept open and warm between reviews.
+
+    A review leases an engine (see lease), uses it alone and gives it back. The pool opens
+    engines on demand, up to `size`, configures them with `options` (threads and hash set the
+    UCI Threads and Hash options) and, with warmup, runs a short search on each new engine so
+    that the network load and the hash allocation do not fall on the first review. min_size
+    engines are opened when the pool is created and are never reaped.
+
+    A leased engine is pinged first and replaced if it died. Engines idle for more than
+    idle_timeout seconds are closed (see reap_idle, also run on every release).
+    """
+
+    def __init__(self, command=None, size=1, threads=None, hash=None, options=None, warmup=True,
+                 min_size=1, idle_timeout=300):
+        if command is None:
+            from saulochess import chess_review
+            command = chess_review.stockfish_path
+        if size < 1:
+            raise ValueError(f"O pool precisa de pelo menos um motor (size={size})")
+
+        self.command = command
+        self.size = size
+        self.options = engine_options(options, threads, hash)
+        self.warmup = warmup
+        self.min_size = min(min_size, size)
+        self.idle_timeout = idle_timeout
+        self.pid = os.getpid()
+
+        self._idle = []  # (engine, released_at), the most recently used last
+        self._open_count = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self.opened = 0
+        self.leases = 0
+        self.waits = 0
+        self.reaped = 0
+        self.broken = 0
+
+        try:
+            for _ in range(self.min_size):
+                engine = self._open()
+                with self._cond:
+                    self._open_count += 1
+                    self._idle.append((engine, time.monotonic()))
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self):
+        engine = chess.engine.SimpleEngine.popen_uci(self.command)
+        try:
+            if self.options:
+                engine.configure(self.options)
+            if self.warmup:
+                engine.analyse(chess.Board(), chess.engine.Limit(depth=1))
+        except Exception:
+            engine.close()
+            raise
+        open_engines[engine] = os.getpid()
+        with self._cond:
+            self.opened += 1
+        return engine
+
+    def _discard(self, engine):
+        # o motor sai do pool; fechá-lo pode falhar se o processo já morreu
+        with self._cond:
+            self._open_count -= 1
+            self._cond.notify()
+        open_engines.pop(engine, None)
+        try:
+            engine.quit()
+        except Exception:
+            engine.close()
+
+    def acquire(self, timeout=None):
+        """Takes an engine out of the pool, waiting up to timeout seconds (None: forever)
+        when all of them are leased. Returns None if the wait timed out."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("O pool de motores foi fechado")
+                    if self._idle:
+                        engine = self._idle.pop()[0]
+                        break
+                    if self._open_count < self.size:
+                        self._open_count += 1
+                        engine = None
+                        break
+
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    self.waits += 1
+                    self._cond.wait(remaining)
+
+            if engine is None:
+                try:
+                    engine = self._open()
+                except Exception:
+                    with self._cond:
+                        self._open_count -= 1
+                        self._cond.notify()
+                    raise
+            else:
+                try:
+                    engine.ping()
+                except Exception:
+                    # o processo morreu enquanto estava livre: abre outro no lugar
+                    with self._cond:
+                        self.broken += 1
+                    self._discard(engine)
+                    continue
+
+            with self._cond:
+                self.leases += 1
+            return engine
+
+    def release(self, engine, broken=False):
+        """Gives a leased engine back; a broken one is closed instead."""
+        with self._cond:
+            self.broken += bool(broken)
+            keep = not (broken or self._closed)
+            if keep:
+                self._idle.append((engine, time.monotonic()))
+                self._cond.notify()
+        if not keep:
+            self._discard(engine)
+        self.reap_idle()
+
+    def open_spare(self):
+        """Opens an engine configured and warmed up like the pool's, outside of it (it does not
+        count against size): for work that cannot wait for a leased engine. Close it with close_spare."""
+        return self._open()
+
+    def close_spare(self, engine):
+        open_engines.pop(engine, None)
+        try:
+            engine.quit()
+        except Exception:
+            engine.close()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """with pool.lease() as engine: ... gives the engine back at the end of the block."""
+        engine = self.acquire(timeout)
+        if engine is None:
+            raise TimeoutError(f"Nenhum motor livre no pool após {timeout}s")
+
+        broken = False
+        try:
+            yield engine
+        except (chess.engine.EngineError, chess.engine.EngineTerminatedError):
+            broken = True
+            raise
+        finally:
+            self.release(engine, broken)
+
+    def reap_idle(self):
+        """Closes the engines idle for more than idle_timeout, keeping min_size open. Returns how many."""
+        if self.idle_timeout is None:
+            return 0
+
+        expired = []
+        with self._cond:
+            limit = time.monotonic() - self.idle_timeout
+            # os mais antigos ficam no começo da lista
+            while self._idle and self._idle[0][1] < limit and self._open_count - len(expired) > self.min_size:
+                expired.append(self._idle.pop(0)[0])
+            self.reaped += len(expired)
+
+        for engine in expired:
+            self._discard(engine)
+        return len(expired)
+
+    def close(self):
+        """Closes the idle engines; leased ones are closed when given back."""
+        with self._cond:
+            self._closed = True
+            idle = [engine for engine, _ in self._idle]
+            self._idle = []
+            self._cond.notify_all()
+        for engine in idle:
+            self._discard(engine)
+
+    def identity(self):
+        return pool_identity(self.command, self.options)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._open_count,
+                'idle': len(self._idle),
+                'leased': self._open_count - len(self._idle),
+                'opened': self.opened,
+                'leases': self.leases,
+                'waits': self.waits,
+                'reaped': self.reaped,
+                'broken': self.broken,
+            }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Pool used by pgn_game_review when no engine is passed, created on first use (see default_pool)
+default_settings = {}
+pool = None
+pool_lock = threading.Lock()
+
+
+def configure_default_pool(**settings):
+    """Sets the EnginePool arguments of the default pool (size, threads, hash, options...).
+    A default pool already open is closed; the next review opens a new one."""
+    global default_settings
+    global pool
+    with pool_lock:
+        previous, pool = pool, None
+        default_settings = settings
+    if previous is not None and previous.pid == os.getpid():
+        previous.close()
+
+
+def default_pool():
+    """The process-wide EnginePool shared by every review that does not pass an engine."""
+    global pool
+    from saulochess import chess_review
+
+    command = default_settings.get('command') or chess_review.stockfish_path
+    with pool_lock:
+        current = pool
+        # um processo filho (fork) não usa os motores do pai; stockfish_path pode ter mudado
+        if current is None or current.pid != os.getpid() or current.command != command:
+            # sem size, até um motor por núcleo: revisões simultâneas não esperam umas pelas outras
+            pool = EnginePool(**{'size': os.cpu_count() or 1, **default_settings, 'command': command})
+            if current is not None and current.pid == os.getpid():
+                current.close()
+        return pool
+
+
+def default_identity():
+    """identity() of the default pool, without opening it."""
+    from saulochess import chess_review
+
+    command = default_settings.get('command') or chess_review.stockfish_path
+    options = engine_options(default_settings.get('options'), default_settings.get('threads'), default_settings.get('hash'))
+    return pool_identity(command, options)
+
+
+def close_engines():
+    if pool is not None and pool.pid == os.getpid():
+        pool.close()
+    # depois de um fork, os motores do pai não são deste processo (e a thread deles não existe aqui)
+    for engine, pid in list(open_engines.items()):
+        if pid == os.getpid():
+            open_engines.pop(engine, None)
+            engine.close()
+
+
+# Cada motor do python-chess roda numa thread que não é daemon: os motores têm que ser fechados antes
+# de o interpretador esperar por elas (como faz concurrent.futures), senão o processo não termina.
+getattr(threading, '_register_atexit', atexit.register)(close_engines)
@@ -0,0 +1,220 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+import chess
+import chess.engine
+import chess.polyglot
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are kept apart
+    fcntl = None
+
+MAGIC = b'SCEVAL01'
+# magic, capacity (slots), ways per bucket, write clock
+HEADER = struct.Struct('<8sQII')
+HEADER_SIZE = 64
+# zobrist hash, context hash, score (cp), mate distance, flags, pv length, 4 pv moves, write stamp, depth swing
+RECORD = struct.Struct('<QQihBB4HIi')
+PV_MOVES = 4
+
+FLAG_VALID = 1
+FLAG_MATE = 2
+FLAG_WINNING = 4
+# the record has the depth swing of the search (chess_review.depth_swing); older files have no such records
+FLAG_SWING = 8
+
+
+def encode_move(move):
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def decode_move(code):
+    promotion = code >> 12
+    return chess.Move(code & 63, (code >> 6) & 63, promotion or None)
+
+
+def context_hash(context):
+    return int.from_bytes(hashlib.blake2b(repr(context).encode(), digest_size=8).digest(), 'little')
+
+
+class EvalStore:
+    """On-disk, memory-mapped hash table of engine evaluations.
+
+    Entries are keyed by a position's Zobrist hash plus a context (engine identity and limit)
+    and hold the score, the mate distance, the first PV moves and, for searches made with
+    escalation, how much the score moved between the last two depths. The file has a fixed
+    number of slots grouped in buckets of `ways`; when a bucket is full the oldest write
+    in it is evicted. Several processes on one host can read and write the same file:
+    reads take a shared flock and writes an exclusive one.
+
+    Only single-line searches are stored: a MultiPV search is not answered from the
+    store, but its first line is kept as the single-line entry of its position.
+    """
+
+    def __init__(self, path, capacity=1 << 20, ways=4):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._open(capacity, ways)
+
+    def _open(self, capacity, ways):
+        self._pid = os.getpid()
+        self._file = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+
+        self._flock(exclusive=True)
+        try:
+            self._file.seek(0, os.SEEK_END)
+            if self._file.tell() < HEADER_SIZE:
+                capacity = max(ways, capacity - capacity % ways)
+                self._file.truncate(HEADER_SIZE + capacity * RECORD.size)
+                self._file.seek(0)
+                self._file.write(HEADER.pack(MAGIC, capacity, ways, 0))
+                self._file.flush()
+        finally:
+            self._funlock()
+
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self.capacity, self.ways, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{self.path} não é um arquivo de avaliações do saulochess')
+        self.n_buckets = self.capacity // self.ways
+
+    def _flock(self, exclusive):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def _funlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _check_fork(self):
+        # flock is shared with the parent after a fork, so a child process reopens the file
+        if os.getpid() != self._pid:
+            self._map.close()
+            self._file.close()
+            self._open(self.capacity, self.ways)
+
+    def _slots(self, zobrist, context):
+        bucket = (zobrist ^ context) % self.n_buckets
+        first = HEADER_SIZE + bucket * self.ways * RECORD.size
+        return range(first, first + self.ways * RECORD.size, RECORD.size)
+
+    def get(self, board, context):
+        """Returns an analyse-style info dict for the board, or None."""
+        zobrist = chess.polyglot.zobrist_hash(board)
+        context = context_hash(context)
+
+        with self._lock:
+            self._check_fork()
+            self._flock(exclusive=False)
+            try:
+                record = None
+                for offset in self._slots(zobrist, context):
+                    entry = RECORD.unpack_from(self._map, offset)
+                    if (entry[4] & FLAG_VALID) and entry[0] == zobrist and entry[1] == context:
+                        record = entry
+                        break
+            finally:
+                self._funlock()
+
+        if record is not None:
+            _, _, score, mate, flags, pv_length, *rest, stamp, swing = record
+            pv = [decode_move(code) for code in rest[:pv_length]]
+            if pv and not board.is_legal(pv[0]):
+                # colisão de hash
+                record = None
+
+        with self._lock:
+            if record is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if record is None:
+            return None
+
+        if flags & FLAG_MATE:
+            if flags & FLAG_WINNING:
+                relative = chess.engine.Mate(mate) if mate else chess.engine.MateGiven
+            else:
+                relative = chess.engine.Mate(-mate)
+        else:
+            relative = chess.engine.Cp(score)
+
+        info = {'score': chess.engine.PovScore(relative, board.turn), 'pv': pv}
+        if flags & FLAG_SWING:
+            info['depth_swing'] = swing
+        return info
+
+    def put(self, board, context, info):
+        if 'score' not in info:
+            return
+
+        zobrist = chess.polyglot.zobrist_hash(board)
+        context = context_hash(context)
+
+        relative = info['score'].relative
+        flags = FLAG_VALID
+        score = 0
+        mate = 0
+        if relative.is_mate():
+            flags |= FLAG_MATE
+            if relative > chess.engine.Cp(0):
+                flags |= FLAG_WINNING
+            mate = abs(relative.mate())
+        else:
+            score = relative.score()
+
+        swing = info.get('depth_swing')
+        if swing is not None:
+            flags |= FLAG_SWING
+
+        pv = [encode_move(m) for m in info.get('pv', [])[:PV_MOVES]]
+        pv_length = len(pv)
+        pv += [0] * (PV_MOVES - pv_length)
+
+        with self._lock:
+            self._check_fork()
+            self._flock(exclusive=True)
+            try:
+                magic, capacity, ways, clock = HEADER.unpack_from(self._map, 0)
+                clock = (clock + 1) & 0xFFFFFFFF
+                HEADER.pack_into(self._map, 0, magic, capacity, ways, clock)
+
+                target = None
+                oldest = None
+                for offset in self._slots(zobrist, context):
+                    entry = RECORD.unpack_from(self._map, offset)
+                    if not (entry[4] & FLAG_VALID) or (entry[0] == zobrist and entry[1] == context):
+                        target = offset
+                        break
+                    # o relógio dá a volta em 32 bits: a idade é contada módulo 2**32
+                    age = (clock - entry[-2]) & 0xFFFFFFFF
+                    if oldest is None or age > oldest[1]:
+                        oldest = (offset, age)
+                if target is None:
+                    target = oldest[0]
+
+                RECORD.pack_into(self._map, target, zobrist, context, score, mate, flags, pv_length, *pv, clock, swing or 0)
+            finally:
+                self._funlock()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'capacity': self.capacity,
+            'hit_rate': hits / total if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._map.close()
+            self._file.close()
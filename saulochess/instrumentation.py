@@ -0,0 +1,215 @@
+import contextvars
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+
+
+class Instrumentation:
+    """Hooks called by the review code. Every method is a no-op here.
+
+    Subclass it (or use Metrics) and make it active for the whole process with install,
+    or for one block of code with using_instrumentation. The hooks are called from the
+    threads that do the work, so they must be thread-safe.
+    """
+
+    def engine_call(self, engine, seconds, info):
+        """An engine search finished after `seconds`; info is its (first) info dict."""
+
+    def detector_call(self, name, seconds):
+        """A review_move detector ran for `seconds` (including the detectors it called)."""
+
+    def error(self, stage, error, **context):
+        """An error the review recovered from, e.g. stage='ply' with ply=... and move=..."""
+
+
+EngineCall = namedtuple('EngineCall', 'engine finished seconds depth nodes nps')
+
+
+class Metrics(Instrumentation):
+    """Instrumentation that keeps counters of everything, for logs and dashboards.
+
+    The last `history` engine calls are kept one by one (see recent_engine_calls), to spot
+    an engine slowing down under load; the rest are only summed up.
+    """
+
+    def __init__(self, history=1000):
+        self._lock = threading.Lock()
+        self.history = history
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.engines = {}    # engine -> [calls, seconds, nodes]
+            self.detectors = {}  # name -> [calls, seconds]
+            self.errors = {}     # stage -> count
+            self.last_errors = deque(maxlen=20)
+            self.engine_calls = deque(maxlen=self.history)
+
+    def engine_call(self, engine, seconds, info):
+        info = info or {}
+        nodes = info.get('nodes')
+        nps = info.get('nps')
+        if nps is None and nodes is not None and seconds > 0:
+            nps = int(nodes / seconds)
+
+        with self._lock:
+            totals = self.engines.setdefault(engine, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += nodes or 0
+            self.engine_calls.append(EngineCall(engine, time.time(), seconds, info.get('depth'), nodes, nps))
+
+    def detector_call(self, name, seconds):
+        with self._lock:
+            totals = self.detectors.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    def error(self, stage, error, **context):
+        with self._lock:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+            self.last_errors.append((stage, str(error), context))
+
+    def recent_engine_calls(self):
+        with self._lock:
+            return list(self.engine_calls)
+
+    def summary(self):
+        """Plain dict of the counters, plus the hit rates of the caches in use."""
+        from saulochess import chess_review
+
+        with self._lock:
+            engines = {
+                engine: {
+                    'calls': calls,
+                    'seconds': seconds,
+                    'mean_ms': 1000 * seconds / calls,
+                    'nodes': nodes,
+                    'nps': int(nodes / seconds) if seconds > 0 else None,
+                }
+                for engine, (calls, seconds, nodes) in self.engines.items()
+            }
+            detectors = {
+                name: {'calls': calls, 'seconds': seconds, 'mean_ms': 1000 * seconds / calls}
+                for name, (calls, seconds) in sorted(self.detectors.items(), key=lambda item: -item[1][1])
+            }
+            errors = dict(self.errors)
+
+        return {
+            'engine_calls': sum(engine['calls'] for engine in engines.values()),
+            'engine_seconds': sum(engine['seconds'] for engine in engines.values()),
+            'engines': engines,
+            'detectors': detectors,
+            'errors': errors,
+            'caches': chess_review.cache_stats(),
+        }
+
+
+# Instrumentation of the whole process (install) and of the current thread or asyncio task
+installed = None
+current_instrumentation = contextvars.ContextVar('current_instrumentation', default=None)
+
+
+def install(instrumentation):
+    """Makes instrumentation active everywhere (None removes it); returns the previous one."""
+    global installed
+    previous = installed
+    installed = instrumentation
+    return previous
+
+
+def active_instrumentation():
+    instrumentation = current_instrumentation.get()
+    if instrumentation is None:
+        instrumentation = installed
+    return instrumentation
+
+
+@contextmanager
+def using_instrumentation(instrumentation):
+    """Makes instrumentation the active one inside the block (in this thread or task only)."""
+    token = current_instrumentation.set(instrumentation)
+    try:
+        yield instrumentation
+    finally:
+        current_instrumentation.reset(token)
+
+
+class ProgressReporter:
+    """Receives the progress of the long loops (one step per ply). Every method is a no-op here."""
+
+    def start(self, total, description=None):
+        pass
+
+    def advance(self, steps=1):
+        pass
+
+    def finish(self):
+        pass
+
+
+class TqdmProgress(ProgressReporter):
+    """A tqdm progress bar, as the reviews always showed."""
+
+    def __init__(self, **options):
+        self.options = options
+        self.bar = None
+
+    def start(self, total, description=None):
+        from tqdm import tqdm
+        self.bar = tqdm(total=total, desc=description, **self.options)
+
+    def advance(self, steps=1):
+        self.bar.update(steps)
+
+    def finish(self):
+        self.bar.close()
+        self.bar = None
+
+
+class CallbackProgress(ProgressReporter):
+    """Calls callback(done, total, description) after every step."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def start(self, total, description=None):
+        self.done = 0
+        self.total = total
+        self.description = description
+
+    def advance(self, steps=1):
+        self.done += steps
+        self.callback(self.done, self.total, self.description)
+
+
+# Fábrica do reporter de cada laço; None desliga o progresso
+progress_factory = TqdmProgress
+
+
+def set_progress(factory):
+    """Sets what reports the progress of later loops: a ProgressReporter class or any callable
+    returning a new reporter, or None for no progress at all. Returns the previous factory."""
+    global progress_factory
+    previous = progress_factory
+    progress_factory = factory
+    return previous
+
+
+def track(iterable, total=None, description=None):
+    """Iterates over iterable, reporting each step to a new reporter of progress_factory."""
+    if progress_factory is None:
+        yield from iterable
+        return
+
+    if total is None:
+        total = len(iterable)
+    reporter = progress_factory()
+    reporter.start(total, description)
+    try:
+        for item in iterable:
+            yield item
+            reporter.advance()
+    finally:
+        reporter.finish()
@@ -0,0 +1,205 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+# put sweeps the cache directory every SWEEP_EVERY writes (see ReviewCache.sweep)
+SWEEP_EVERY = 64
+
+
+def review_key(*parts):
+    """Stable hex digest of the parts of a review request (they must have a stable repr)."""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+class ReviewCache:
+    """Bounded cache of finished game reviews.
+
+    Results are stored pickled: every get returns a fresh copy that the caller may change
+    freely, and the pickled size is what counts against max_bytes. Entries beyond
+    maxsize or max_bytes are evicted least recently used first, and entries older than
+    ttl seconds are dropped. With a path, entries are also written to that directory
+    and survive restarts (and are shared by processes using the same directory); the
+    directory is kept under disk_bytes (None: no limit), see sweep.
+    """
+
+    def __init__(self, maxsize=128, max_bytes=64 * 1024 * 1024, ttl=None, path=None, disk_bytes=1024 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self.disk_bytes = disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._data = OrderedDict()  # key -> (created, pickled result)
+        self._lock = threading.Lock()
+        self._writes = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self.sweep()
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.pkl')
+
+    def _evict(self):
+        while self._data and (len(self._data) > self.maxsize or self.bytes > self.max_bytes):
+            _, (_, blob) = self._data.popitem(last=False)
+            self.bytes -= len(blob)
+
+    def _remember(self, key, created, blob):
+        if key in self._data:
+            self.bytes -= len(self._data.pop(key)[1])
+        if len(blob) > self.max_bytes:
+            return
+        self._data[key] = (created, blob)
+        self.bytes += len(blob)
+        self._evict()
+
+    def _load(self, key):
+        # Entrada gravada em disco (por este ou outro processo)
+        try:
+            with open(self._file(key), 'rb') as f:
+                created, blob = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if self._expired(created):
+            try:
+                os.remove(self._file(key))
+            except OSError:
+                pass
+            return None
+        return created, blob
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._data[key]
+                self.bytes -= len(entry[1])
+                entry = None
+            if entry is not None:
+                self._data.move_to_end(key)
+
+        if entry is None and self.path is not None:
+            entry = self._load(key)
+            if entry is not None:
+                with self._lock:
+                    self._remember(key, *entry)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if entry is None:
+            return None
+        return pickle.loads(entry[1])
+
+    def put(self, key, result, created=None):
+        # created: momento da inserção a manter (veja replace); o ttl conta a partir dele
+        if created is None:
+            created = time.time()
+        blob = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._remember(key, created, blob)
+
+        if self.path is not None:
+            # Escrita atômica: outros processos nunca leem um arquivo pela metade
+            temporary = f'{self._file(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temporary, 'wb') as f:
+                pickle.dump((created, blob), f, protocol=pickle.HIGHEST_PROTOCOL)
+            # sweep expira os arquivos pela data de modificação
+            os.utime(temporary, (created, created))
+            os.replace(temporary, self._file(key))
+
+            with self._lock:
+                self._writes += 1
+                sweep = self._writes % SWEEP_EVERY == 0
+            if sweep:
+                self.sweep()
+
+    def replace(self, key, result):
+        """Stores result in place of the entry under key, keeping its insertion time so a
+        changed copy does not extend its life. Returns False, storing nothing, when the
+        entry is gone (evicted or expired)."""
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None and self.path is not None:
+            entry = self._load(key)
+        if entry is None or self._expired(entry[0]):
+            return False
+        self.put(key, result, created=entry[0])
+        return True
+
+    def sweep(self):
+        """Deletes the expired files of the cache directory, then the oldest ones until the
+        directory fits in disk_bytes. Returns how many files were deleted.
+
+        Runs when the cache is created and every SWEEP_EVERY writes; other processes sharing
+        the directory may be sweeping it too, so files that vanish are skipped.
+        """
+        if self.path is None:
+            return 0
+
+        files = []
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith('.pkl'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()  # os mais antigos primeiro
+
+        now = time.time()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for written, size, file in files:
+            expired = self.ttl is not None and now - written > self.ttl
+            if not expired and (self.disk_bytes is None or total <= self.disk_bytes):
+                break
+            try:
+                os.remove(file)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+        if self.path is not None:
+            for name in os.listdir(self.path):
+                if name.endswith('.pkl'):
+                    try:
+                        os.remove(os.path.join(self.path, name))
+                    except OSError:
+                        pass
+
+    def stats(self):
+        with self._lock:
+            hits, misses, size, used = self.hits, self.misses, len(self._data), self.bytes
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'size': size,
+            'bytes': used,
+            'maxsize': self.maxsize,
+            'max_bytes': self.max_bytes,
+            'hit_rate': hits / total if total else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._data)
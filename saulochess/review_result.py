@@ -0,0 +1,266 @@
+import chess
+import numpy as np
+
+from saulochess.eval_store import decode_move, encode_move
+
+# Codes of GameReview.classifications; 'error' marks a failed review, 'ERROR' a failed ply
+CLASSIFICATIONS = (
+    '', 'ERROR', 'error', 'book', 'best', 'excellent', 'good', 'inaccuracy', 'mistake', 'blunder',
+    'brilliant', 'great', 'miss',
+)
+CLASSIFICATION_CODES = {name: code for code, name in enumerate(CLASSIFICATIONS)}
+
+# Order of the metric matrices, as in the legacy tuple (indexes 8 to 11)
+METRICS = ('development', 'tension', 'mobility', 'control')
+
+# Element names of the legacy 18-tuple
+LEGACY_FIELDS = (
+    'san_moves', 'fens', 'score_list', 'classification_list', 'reviews', 'best_reviews',
+    'san_best_moves', 'uci_best_moves', 'devs', 'tens', 'mobs', 'conts',
+    'white_accuracy', 'black_accuracy', 'white_elo', 'black_elo', 'white_acpl', 'black_acpl',
+)
+
+NO_MOVE = 0  # a1a1, never a legal move
+
+
+class GameReview:
+    """Result of pgn_game_review, stored column by column.
+
+    Per-ply data lives in NumPy arrays: moves and best moves as uint16 codes, scores as
+    int32, classifications as uint8 codes (see CLASSIFICATIONS) and the metrics as an int16
+    array of shape (4, plies, 2) in METRICS order, white then black. SAN moves and FENs are
+    rebuilt from the moves when asked for.
+
+    It still behaves as the legacy 18-tuple: it unpacks, indexes and slices the same way.
+    """
+
+    __slots__ = (
+        'moves', 'scores', 'classifications', 'reviews', 'best_reviews', 'best_moves', 'metrics',
+        'white_accuracy', 'black_accuracy', 'white_elo', 'black_elo', 'white_acpl', 'black_acpl', 'failed',
+        'cache_key',
+    )
+
+    def __init__(self, moves, scores, classifications, reviews, best_reviews, best_moves, metrics,
+                 white_accuracy, black_accuracy, white_elo, black_elo, white_acpl, black_acpl, failed=False):
+        self.moves = moves
+        self.scores = scores
+        self.classifications = classifications
+        self.reviews = reviews
+        self.best_reviews = best_reviews
+        self.best_moves = best_moves
+        self.metrics = metrics
+        self.white_accuracy = white_accuracy
+        self.black_accuracy = black_accuracy
+        self.white_elo = white_elo
+        self.black_elo = black_elo
+        self.white_acpl = white_acpl
+        self.black_acpl = black_acpl
+        self.failed = failed
+        # key of the review_cache entry this review came from (set by pgn_game_review), see best_review
+        self.cache_key = None
+
+    @classmethod
+    def from_lists(cls, uci_moves, scores, classification_list, review_list, best_review_list, uci_best_moves,
+                   metrics, white_accuracy, black_accuracy, white_elo, black_elo, white_acpl, black_acpl):
+        """Builds a review from the per-ply lists of analyse_game; metrics is (devs, mobs, tens, conts)."""
+        devs, mobs, tens, conts = metrics
+        return cls(
+            encode_moves(uci_moves),
+            np.asarray(scores, dtype=np.int32).reshape(-1),
+            np.fromiter((CLASSIFICATION_CODES[c] for c in classification_list), dtype=np.uint8,
+                        count=len(classification_list)),
+            list(review_list),
+            list(best_review_list),
+            encode_moves(uci_best_moves),
+            np.asarray([devs, tens, mobs, conts], dtype=np.int16).reshape(4, -1, 2),
+            white_accuracy, black_accuracy, white_elo, black_elo, white_acpl, black_acpl,
+        )
+
+    @classmethod
+    def from_failure(cls, uci_moves):
+        """Review of a game whose analysis failed; its tuple view is the legacy failure tuple."""
+        n = len(uci_moves)
+        return cls(
+            encode_moves(uci_moves),
+            np.zeros(n, dtype=np.int32),
+            np.full(n, CLASSIFICATION_CODES['error'], dtype=np.uint8),
+            [''] * n,
+            [''] * n,
+            np.zeros(n, dtype=np.uint16),
+            np.zeros((4, n, 2), dtype=np.int16),
+            0.0, 0.0, 0, 0, 0.0, 0.0,
+            failed=True,
+        )
+
+    def __getstate__(self):
+        # raw buffers pickle much faster than one ndarray object per column
+        return (
+            len(self.moves), self.moves.tobytes(), self.scores.tobytes(), self.classifications.tobytes(),
+            self.best_moves.tobytes(), self.metrics.tobytes(), self.reviews, self.best_reviews,
+            self.white_accuracy, self.black_accuracy, self.white_elo, self.black_elo,
+            self.white_acpl, self.black_acpl, self.failed,
+        )
+
+    def __setstate__(self, state):
+        n, moves, scores, classifications, best_moves, metrics, *rest = state
+        self.moves = np.frombuffer(moves, dtype=np.uint16).copy()
+        self.scores = np.frombuffer(scores, dtype=np.int32).copy()
+        self.classifications = np.frombuffer(classifications, dtype=np.uint8).copy()
+        self.best_moves = np.frombuffer(best_moves, dtype=np.uint16).copy()
+        self.metrics = np.frombuffer(metrics, dtype=np.int16).reshape(4, n, 2).copy()
+        (self.reviews, self.best_reviews, self.white_accuracy, self.black_accuracy, self.white_elo,
+         self.black_elo, self.white_acpl, self.black_acpl, self.failed) = rest
+        self.cache_key = None
+
+    def __len__(self):
+        return len(LEGACY_FIELDS)
+
+    def __iter__(self):
+        return iter(self.to_tuple())
+
+    def __getitem__(self, index):
+        if self.failed or isinstance(index, slice):
+            return self.to_tuple()[index]
+        return getattr(self, LEGACY_FIELDS[index])
+
+    def __repr__(self):
+        state = 'failed' if self.failed else f'{self.white_accuracy:.1f}/{self.black_accuracy:.1f}'
+        return f'GameReview(plies={len(self.moves)}, accuracy={state})'
+
+    @property
+    def uci_moves(self):
+        return [decode_move(code) for code in self.moves.tolist()]
+
+    def replay(self):
+        # SAN of the moves and of the best moves, and the FEN after each move
+        board = chess.Board()
+        san_moves = []
+        san_best_moves = []
+        fens = []
+        for code, best_code in zip(self.moves.tolist(), self.best_moves.tolist()):
+            san_best_moves.append(board.san(decode_move(best_code)) if best_code != NO_MOVE else '')
+            move = decode_move(code)
+            san_moves.append(board.san(move))
+            board.push(move)
+            fens.append(board.fen())
+        return san_moves, san_best_moves, fens
+
+    @property
+    def san_moves(self):
+        return self.replay()[0]
+
+    @property
+    def san_best_moves(self):
+        return self.replay()[1]
+
+    @property
+    def fens(self):
+        return self.replay()[2]
+
+    @property
+    def score_list(self):
+        return self.scores.tolist()
+
+    @property
+    def classification_list(self):
+        return [CLASSIFICATIONS[code] for code in self.classifications.tolist()]
+
+    @property
+    def uci_best_moves(self):
+        # [from, to] pairs, as seperate_squares_in_move_list
+        pairs = []
+        for code in self.best_moves.tolist():
+            uci = decode_move(code).uci() if code != NO_MOVE else ''
+            pairs.append([uci[:2], uci[2:]])
+        return pairs
+
+    @property
+    def devs(self):
+        return self.metrics[0].tolist()
+
+    @property
+    def tens(self):
+        return self.metrics[1].tolist()
+
+    @property
+    def mobs(self):
+        return self.metrics[2].tolist()
+
+    @property
+    def conts(self):
+        return self.metrics[3].tolist()
+
+    def best_review(self, ply, engine=None, language='en', openings_df=None, config=None):
+        """best_reviews[ply], written now when the review was made with best_reviews='lazy'.
+
+        Pass the engine, language, openings and AnalysisConfig the game was reviewed with.
+        The review describes the stored best move (best_moves[ply]), and is also written back
+        to the review_cache entry this review came from (ReviewCache.replace, which keeps its ttl).
+        """
+        if self.best_reviews[ply] is None:
+            from saulochess import chess_review
+
+            previous_review = self.reviews[ply - 1] if ply > 0 else None
+            best_code = int(self.best_moves[ply])
+            self.best_reviews[ply] = chess_review.best_review_at(
+                self.uci_moves, ply, previous_review, engine=engine, language=language,
+                openings_df=openings_df, config=config,
+                best_move=decode_move(best_code) if best_code != NO_MOVE else None
+            )
+
+            # o review_cache devolve cópias: sem isso a próxima cópia escreveria a review de novo
+            cache = chess_review.review_cache
+            if self.cache_key is not None and cache is not None:
+                cache.replace(self.cache_key, self)
+        return self.best_reviews[ply]
+
+    def to_tuple(self):
+        """The legacy 18-tuple of pgn_game_review."""
+        san_moves, san_best_moves, fens = self.replay()
+        n = len(san_moves)
+
+        if self.failed:
+            return (
+                san_moves, fens, [0]*n, ['error']*n, ['Análise Falhou'], ['Análise Falhou'],
+                ['?'], ['?'], [0]*n, [0]*n, [0]*n, [0]*n,
+                0.0, 0.0, 0, 0, 0.0, 0.0
+            )
+
+        return (
+            san_moves, fens, self.score_list, self.classification_list, list(self.reviews), list(self.best_reviews),
+            san_best_moves, self.uci_best_moves, self.devs, self.tens, self.mobs, self.conts,
+            self.white_accuracy, self.black_accuracy, self.white_elo, self.black_elo, self.white_acpl, self.black_acpl
+        )
+
+    def to_pandas(self):
+        """One row per ply."""
+        import pandas as pd
+
+        san_moves, san_best_moves, _ = self.replay()
+        columns = {
+            'ply': np.arange(1, len(self.moves) + 1),
+            'move': [move.uci() for move in self.uci_moves],
+            'san': san_moves,
+            'score': self.scores,
+            'classification': pd.Categorical.from_codes(self.classifications, CLASSIFICATIONS),
+            'review': self.reviews,
+            'best_review': self.best_reviews,
+            'best_move': [decode_move(code).uci() if code != NO_MOVE else '' for code in self.best_moves.tolist()],
+            'san_best': san_best_moves,
+        }
+        for name, matrix in zip(METRICS, self.metrics):
+            columns[f'white_{name}'] = matrix[:, 0]
+            columns[f'black_{name}'] = matrix[:, 1]
+        return pd.DataFrame(columns)
+
+
+def encode_moves(moves):
+    # chess.Move, UCI string or '' / None (no move)
+    codes = np.zeros(len(moves), dtype=np.uint16)
+    for i, move in enumerate(moves):
+        if not move:
+            continue
+        if isinstance(move, str):
+            move = chess.Move.from_uci(move)
+        codes[i] = encode_move(move)
+    return codes
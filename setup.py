@@ -5,7 +5,7 @@ setup(
     version='0.1.7.01',
     
     # Encontra a pasta 'saulochess' e a trata como o pacote principal
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     
     description='Ferramentas de análise e revisão de partidas de xadrez baseadas em Stockfish.',
     
@@ -0,0 +1,68 @@
+import contextlib
+import io
+import unittest
+
+import chess
+import chess.engine
+
+from benchmarks.run import FAKE_ENGINE
+from saulochess import chess_review, instrumentation
+
+# With the scripted engine the Queen's Gambit Accepted ends a pawn down for white (-200)
+BOOK_LINE = "1. d4 d5 2. c4 dxc4 3. e3"
+PGN = "1. d4 d5 2. c4 dxc4 3. e3 b5 4. a4 c6 5. axb5 cxb5 6. Qf3 Nc6"
+CONFIG = chess_review.AnalysisConfig('depth', depth=8)
+
+
+class BookPliesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = chess.engine.SimpleEngine.popen_uci(FAKE_ENGINE)
+        cls.previous_cache = chess_review.review_cache
+        chess_review.review_cache = None
+        cls.previous_progress = instrumentation.set_progress(None)
+
+        cls.openings = chess_review.OpeningIndex()
+        cls.openings.add_line(BOOK_LINE, "Queen's Gambit Accepted")
+        cls.uci_moves, _, _ = chess_review.parse_pgn(PGN)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.quit()
+        chess_review.review_cache = cls.previous_cache
+        instrumentation.set_progress(cls.previous_progress)
+
+    def setUp(self):
+        chess_review.analysis_cache.clear()
+        chess_review.fork_cache.clear()
+
+    def test_intermediate_positions_are_book(self):
+        # only the final position of the line is named, but every ply up to it follows the table
+        self.assertEqual(chess_review.book_plies(self.uci_moves, self.openings), 5)
+        self.assertEqual(chess_review.book_plies(self.uci_moves, None), 0)
+
+    def test_first_book_ply_loses_nothing(self):
+        with chess_review.using_config(CONFIG):
+            scores, cpls_white, cpls_black, _, _ = chess_review.compute_cpl(self.uci_moves, self.engine, openings_df=self.openings)
+        self.assertNotEqual(scores[0], 0)
+        self.assertEqual(cpls_white[:3], [0, 0, 0])
+        self.assertEqual(cpls_black[:2], [0, 0])
+
+    def test_accuracy_starts_where_the_book_ends(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            review = chess_review.pgn_game_review(
+                PGN, False, 'depth', None, 8, engine=self.engine, config=CONFIG, openings_df=self.openings
+            )
+        scores = list(review.scores)
+        self.assertNotEqual(scores[0], 0)
+        self.assertEqual(chess_review.opening_score(scores, self.uci_moves, self.openings), scores[0])
+
+        white_accuracy, black_accuracy = chess_review.calculate_accuracy(scores, scores[0])
+        self.assertAlmostEqual(review.white_accuracy, white_accuracy)
+        self.assertAlmostEqual(review.black_accuracy, black_accuracy)
+        self.assertGreater(review.white_accuracy, chess_review.calculate_accuracy(scores)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()